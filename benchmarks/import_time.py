@@ -0,0 +1,74 @@
+"""Import time benchmark
+
+Measures the time taken to import the package modules on a fresh
+interpreter, and which heavy dependencies each one loads, to keep the
+startup of short lived processes fast.
+
+Exits with an error if any import takes longer than the limit, if given.
+
+Usage:
+    import_time.py [<module>...] [options]
+
+Options:
+    -n <runs>, --runs <runs>        Runs of each import, the best one is reported [default: 5]
+    -l <ms>, --limit <ms>           Max milliseconds allowed for each import
+"""
+
+from docopt import docopt
+
+import json
+import subprocess
+import sys
+
+MODULES = [
+    'utalkpythonclient',
+    'utalkpythonclient._stomp',
+    'utalkpythonclient.transports',
+    'utalkpythonclient.client',
+    'utalkpythonclient.websocket',
+]
+
+# Dependencies that should only be loaded when needed
+HEAVY = ['gevent', 'requests', 'ws4py', 'wsaccel', 'multiprocessing']
+
+MEASURE = """
+import json, sys, time
+start = time.time()
+import {module}
+elapsed = time.time() - start
+loaded = [name for name in {heavy!r} if name in sys.modules]
+print json.dumps([elapsed, loaded])
+"""
+
+
+def measure(module, runs):
+    """
+        Returns the best import time in seconds of a module, and the
+        heavy dependencies loaded by it.
+    """
+    results = []
+    for run in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', MEASURE.format(module=module, heavy=HEAVY)])
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return min(results)
+
+
+def main():
+    arguments = docopt(__doc__)
+    runs = int(arguments['--runs'])
+    limit = float(arguments['--limit']) if arguments['--limit'] else None
+
+    print
+    exceeded = False
+    for module in arguments['<module>'] or MODULES:
+        elapsed, loaded = measure(module, runs)
+        print '  {:<32} {:8.1f} ms   {}'.format(module, elapsed * 1000, ', '.join(loaded))
+        if limit is not None and elapsed * 1000 > limit:
+            exceeded = True
+    print
+
+    if exceeded:
+        sys.exit('Imports slower than {} ms'.format(limit))
+
+if __name__ == '__main__':
+    main()
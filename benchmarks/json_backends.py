@@ -0,0 +1,76 @@
+"""JSON backends benchmark
+
+Measures the per message cost of the json work done by the client with each
+of the json libraries installed: decoding sockjs arrays and STOMP bodies of
+received messages, and encoding the messages sent.
+
+Usage:
+    json_backends.py [<backend>...] [options]
+
+Options:
+    -n <messages>, --messages <messages>    Messages encoded and decoded [default: 20000]
+    -s <size>, --size <size>                Characters of the text of each message [default: 200]
+"""
+
+from docopt import docopt
+from utalkpythonclient.jsoncodec import CODECS
+from utalkpythonclient.jsoncodec import get_codec
+
+import time
+
+
+def sample_message(size):
+    """
+        A packed maxcarrot message as found on a conversation
+    """
+    return {
+        'a': 'a',
+        'o': 'm',
+        'u': {'u': 'testuser1', 'd': 'Test User 1'},
+        'd': {'text': u'Hola caracola \xe9 ' * (size // 16 + 1)},
+        's': 'test',
+        'g': '5542ac1fb7d1dc1b2d2c1a8d',
+        'p': '2015-04-30T14:35:27.002Z',
+    }
+
+
+def measure(name, function, items):
+    start = time.time()
+    for item in items:
+        function(item)
+    elapsed = time.time() - start
+    print '  {:<24} {:8.2f} us/message'.format(name, elapsed * 1e6 / len(items))
+
+
+def run(codec, messages, size):
+    message = sample_message(size)
+    packed = codec.dumps(message)
+    body = u'MESSAGE\ndestination:/exchange/conversation.messages\n\n{}\x00'.format(packed)
+    array = codec.dumps([body]).encode('utf-8')
+    body_start = body.index('\n\n') + 2
+
+    print codec.name
+    measure('encode message', codec.dumps, [message] * messages)
+    measure('encode sockjs string', codec.dumps, [body] * messages)
+    measure('decode sockjs array', lambda data: codec.decode(data, 0, len(data)), [array] * messages)
+    measure('decode STOMP body', lambda data: codec.decode(data, body_start, len(data) - 1), [body] * messages)
+    print
+
+
+def main():
+    arguments = docopt(__doc__)
+    messages = int(arguments['--messages'])
+    size = int(arguments['--size'])
+
+    print
+    for name in arguments['<backend>'] or CODECS.keys():
+        try:
+            codec = get_codec(name)
+        except ImportError:
+            print '{} not installed'.format(name)
+            print
+            continue
+        run(codec, messages, size)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""SockJS parser benchmark
+
+Compares the frames/second of the incremental SockJSParser against the
+regex based parse_sockjs function it replaced, feeding both with the same
+traffic, either a recorded raw sockjs stream or a generated one.
+
+Usage:
+    sockjs_parser.py [<recording>] [options]
+
+Options:
+    -c <size>, --chunk <size>               Size of the reads simulated on the stream [default: 4096]
+    -n <messages>, --messages <messages>    Messages on the generated traffic [default: 5000]
+    -b <batch>, --batch <batch>             Messages per sockjs array on the generated traffic [default: 5]
+"""
+
+from docopt import docopt
+from utalkpythonclient._sockjs import SockJSFrame
+from utalkpythonclient._sockjs import SockJSParser
+
+import json
+import re
+import time
+
+
+def legacy_parse_sockjs(frame):
+    """
+        The regex based parser formerly found in SockJSTransport.parse_sockjs
+    """
+    try:
+        opcode, body = re.search(r'([acmoh])(.*)', frame, re.DOTALL | re.MULTILINE).groups()
+    except:
+        return [], frame
+
+    if opcode in 'oh':
+        return [SockJSFrame(opcode, "")], body
+
+    elif opcode in "a":
+        full_frames = []
+        match = re.search(r'(\[".*?"\])(.*)$', frame, re.DOTALL | re.MULTILINE)
+        if match:
+            full, remaining = match.groups()
+            sockjs_array = json.loads(full)
+            for item in sockjs_array:
+                full_frames.append(SockJSFrame('m', item))
+
+            return full_frames, remaining
+        else:
+            return [], frame
+    elif opcode == 'c':
+        return [SockJSFrame(opcode, '{} "{}"'.format(*json.loads(body)))], ''
+    elif opcode == 'm':
+        raise Exception('Message frame received, {}'.format(body))
+
+    return [], ''
+
+
+def generate_traffic(messages, batch):
+    """
+        Generates a sockjs stream resembling the one received on a busy
+        conversation, with STOMP MESSAGE frames carrying maxcarrot messages.
+    """
+    lines = ['o', 'h']
+    for start in range(0, messages, batch):
+        items = []
+        for index in range(start, min(start + batch, messages)):
+            body = json.dumps({
+                'a': 'a', 'o': 'm', 'g': '54e1a0c2d4f8c7ab12cd34ef',
+                'p': '2015-02-16T12:00:00.{:06d}Z'.format(index % 1000000),
+                'u': {'u': 'user{}'.format(index % 50), 'd': 'User {}'.format(index % 50)},
+                'd': {'text': 'This is Message {} with some "quoted" text'.format(index)}
+            }, separators=(',', ':'))
+            items.append('MESSAGE\nsubscription:sub-0\ndestination:/exchange/user.subscribe/54e1a0c2d4f8c7ab12cd34ef.messages\n'
+                         'content-type:application/json\ncontent-length:{}\n\n{}\x00'.format(len(body), body))
+        lines.append('a' + json.dumps(items))
+        if start % (batch * 20) == 0:
+            lines.append('h')
+    return '\n'.join(lines) + '\n'
+
+
+def chunked(stream, size):
+    return [stream[position:position + size] for position in range(0, len(stream), size)]
+
+
+def run_legacy(chunks):
+    count = 0
+    partial = ''
+    for chunk in chunks:
+        frames, partial = legacy_parse_sockjs(partial + chunk)
+        count += len(frames)
+        # The old parser only extracts the first frame found on each call
+        while frames and partial.strip():
+            frames, partial = legacy_parse_sockjs(partial)
+            count += len(frames)
+    return count
+
+
+def run_parser(chunks):
+    count = 0
+    parser = SockJSParser()
+    for chunk in chunks:
+        count += len(parser.feed(chunk))
+    return count
+
+
+def measure(name, function, chunks):
+    started = time.time()
+    frames = function(chunks)
+    elapsed = time.time() - started
+    print '{:<10} {:>8} frames in {:.3f}s, {:>10.0f} frames/s'.format(name, frames, elapsed, frames / elapsed)
+
+
+def main():
+    arguments = docopt(__doc__)
+
+    if arguments['<recording>']:
+        stream = open(arguments['<recording>']).read()
+    else:
+        stream = generate_traffic(int(arguments['--messages']), int(arguments['--batch']))
+
+    frames = [line for line in stream.split('\n') if line]
+    chunks = chunked(stream, int(arguments['--chunk']))
+
+    print
+    print '  Whole frames ({} frames)'.format(len(frames))
+    measure('legacy', run_legacy, frames)
+    measure('parser', run_parser, frames)
+
+    print
+    print '  Streamed in {} bytes chunks'.format(arguments['--chunk'])
+    measure('legacy', run_legacy, chunks)
+    measure('parser', run_parser, chunks)
+    print
+
+if __name__ == '__main__':
+    main()
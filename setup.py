@@ -28,9 +28,13 @@ A STOMP-trough-websockets python implementation for the UTalk service""",
           'gevent'
 
       ],
+      extras_require={
+          'speedups': ['ujson'],
+      },
       entry_points="""
       # -*- Entry points: -*-
       [console_scripts]
       utalk = utalkpythonclient:main
+      utalk-bench = utalkpythonclient.bench:main
       """,
       )
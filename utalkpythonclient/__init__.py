@@ -11,12 +11,13 @@ Options:
 """
 
 from docopt import docopt
-from utalkpythonclient.client import UTalkClient
+from utalkpythonclient.utils import lazy_attributes
 import getpass
 import sys
 
 
 def main(argv=sys.argv):
+    from utalkpythonclient.client import UTalkClient
 
     arguments = docopt(__doc__, version='UTalk websocket client 1.0')
 
@@ -46,3 +47,7 @@ def main(argv=sys.argv):
 
     client = UTalkClient(**params)
     client.start()
+
+
+# Imported when accessed, so importing any module of the package doesn't load the client
+lazy_attributes(__name__, UTalkClient='utalkpythonclient.client.UTalkClient')
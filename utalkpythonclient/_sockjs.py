@@ -0,0 +1,160 @@
+from collections import namedtuple
+from utalkpythonclient import jsoncodec
+
+import re
+
+SOCKJS_OPEN = 'o'
+SOCKJS_MESSAGE = 'm'
+SOCKJS_ARRAY = 'a'
+SOCKJS_HEARTBEAT = 'h'
+SOCKJS_CLOSE = 'c'
+
+SockJSFrame = namedtuple('SockJSFrame', ['type', 'content'])
+
+# Opcodes of frames with content
+OPCODES = {
+    SOCKJS_ARRAY: SOCKJS_ARRAY,
+    SOCKJS_MESSAGE: SOCKJS_MESSAGE,
+    SOCKJS_CLOSE: SOCKJS_CLOSE,
+}
+
+# Matches the rest of a json string up to its closing quote
+STRING_END = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+
+# Parser states
+IDLE = 0
+OPCODE = 1
+ARRAY = 2
+STRING = 3
+
+
+class SockJSParser(object):
+    """
+        Incremental parser of a stream of sockjs frames.
+
+        Data is fed as it arrives from the transport, and complete frames are
+        returned as soon as they are available. The state of the scan is kept
+        between calls, so data already scanned is never scanned again, and
+        partial frames are only joined once, when complete. Frames contained
+        in a single chunk are decoded in place, without copying them.
+
+        Arrays of messages are transformed into single message frames.
+    """
+
+    def __init__(self):
+        self.state = IDLE
+        self.opcode = None
+        self.escaped = False
+        self.pending = []
+
+    def feed(self, data):
+        """
+            Scans a new chunk of data and returns a list with all the frames
+            completed by it.
+        """
+        frames = []
+        position = 0
+        length = len(data)
+
+        # Start of the current frame in this chunk, if the frame started
+        # in a previous chunk, that part of the frame is already on pending
+        frame_start = 0
+
+        while position < length:
+            if self.state == IDLE:
+                char = data[position]
+                position += 1
+                if char == SOCKJS_OPEN:
+                    frames.append(SockJSFrame(SOCKJS_OPEN, ''))
+                elif char == SOCKJS_HEARTBEAT:
+                    frames.append(SockJSFrame(SOCKJS_HEARTBEAT, ''))
+                elif char in OPCODES:
+                    self.opcode = OPCODES[char]
+                    self.state = OPCODE
+                # Any other character is noise between frames, as newlines
+                # or chunk sizes on raw streaming responses.
+
+            elif self.state == OPCODE:
+                expected = '"' if self.opcode == SOCKJS_MESSAGE else '['
+                if data[position] != expected:
+                    # False opcode, resync from the current character
+                    self.state = IDLE
+                    continue
+
+                frame_start = position
+                position += 1
+                if self.opcode == SOCKJS_MESSAGE:
+                    self.state = STRING
+                else:
+                    self.state = ARRAY
+
+            elif self.state == ARRAY:
+                # Only separators (and the numbers of close frames) are found
+                # between strings, so look at a single character each time
+                char = data[position]
+                position += 1
+                if char == '"':
+                    self.state = STRING
+                elif char == ']':
+                    frames.extend(self.complete(data, frame_start, position))
+
+            elif self.state == STRING:
+                if self.escaped:
+                    # Previous chunk ended with an escaping backslash
+                    self.escaped = False
+                    position += 1
+                    continue
+
+                match = STRING_END.match(data, position)
+                if match is None:
+                    # String continues on next chunk, remember if the last
+                    # character was escaping the first one of the next chunk
+                    self.escaped = self.count_backslashes(data, length, position) % 2 == 1
+                    position = length
+                else:
+                    position = match.end()
+                    if self.opcode == SOCKJS_MESSAGE:
+                        frames.extend(self.complete(data, frame_start, position))
+                    else:
+                        self.state = ARRAY
+
+        if self.state in (ARRAY, STRING):
+            self.pending.append(data[frame_start:])
+
+        return frames
+
+    @staticmethod
+    def count_backslashes(data, end, floor):
+        """
+            Counts the consecutive backslashes found before the end position
+        """
+        position = end
+        while position > floor and data[position - 1] == '\\':
+            position -= 1
+        return end - position
+
+    def complete(self, data, start, end):
+        """
+            Builds the frames contained in a complete sockjs frame body,
+            ending at data[start:end].
+        """
+        if self.pending:
+            # Join the parts received on previous chunks
+            self.pending.append(data[start:end])
+            data = ''.join(self.pending)
+            start = 0
+            end = len(data)
+        value = jsoncodec.codec.decode(data, start, end)[0]
+        opcode = self.opcode
+
+        self.pending = []
+        self.opcode = None
+        self.state = IDLE
+
+        if opcode == SOCKJS_ARRAY:
+            return [SockJSFrame(SOCKJS_MESSAGE, item) for item in value]
+        elif opcode == SOCKJS_MESSAGE:
+            return [SockJSFrame(SOCKJS_MESSAGE, value)]
+        elif opcode == SOCKJS_CLOSE:
+            return [SockJSFrame(SOCKJS_CLOSE, '{} "{}"'.format(*value))]
+        return []
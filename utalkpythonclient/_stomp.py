@@ -1,13 +1,34 @@
 from collections import OrderedDict
-from collections import namedtuple
+from importlib import import_module
+from maxcarrot import RabbitMessage
 from stomp.utils import Frame, convert_frame_to_lines
+from utalkpythonclient import jsoncodec
+from utalkpythonclient.utils import LRUCache
 
-import json
-import pkg_resources
+import os
 import re
 import sys
 
-StompMessage = namedtuple('StompMessage', ['command', 'body', 'json', 'headers'])
+# STOMP 1.1 header value escapes
+HEADER_ESCAPES = {
+    '\\n': '\n',
+    '\\c': ':',
+    '\\\\': '\\',
+    '\\r': '\r',
+}
+HEADER_ESCAPE = re.compile(r'\\.')
+
+# Client version and platform headers sent on CONNECT frames, resolved on first use
+CLIENT_METADATA = None
+
+# Marks json bodies not decoded yet, as None is a valid json value
+MISSING = object()
+
+# Frames whose headers are not escaped, for backwards compatibility with STOMP 1.0
+UNESCAPED_COMMANDS = ('CONNECT', 'CONNECTED')
+
+# Whitespace allowed around json bodies
+WHITESPACE = re.compile(r'[ \t\n\r]*')
 
 
 class StompError(Exception):
@@ -28,55 +49,267 @@ class StompExchangeNotFound(StompError):
     """
 
 
+def stomp_error(body):
+    """
+        Returns the exception matching the error described on a frame body.
+    """
+    if 'Access refused' in body:
+        return StompAccessDenied(body)
+    elif 'NOT_FOUND - no exchange' in body:
+        return StompExchangeNotFound(body)
+    else:
+        return StompError(body)
+
+
+def unescape_header(value):
+    """
+        Replaces the STOMP 1.1 escape sequences found on a header value
+    """
+    return HEADER_ESCAPE.sub(lambda match: HEADER_ESCAPES.get(match.group(), match.group()), value)
+
+
+class StompMessage(object):
+    """
+        A decoded STOMP Frame.
+
+        Only the command is extracted on creation. Headers, body, json body and
+        the maxcarrot message are extracted from the raw frame the first time
+        they are accessed, and memoized.
+    """
+
+    __slots__ = ('raw', 'command', '_headers_start', '_body_start', '_body_end',
+                 '_headers', '_body', '_json', '_message')
+
+    def __init__(self, raw, command, headers_start, body_start):
+        self.raw = raw
+        self.command = command
+        self._headers_start = headers_start
+        self._body_start = body_start
+        self._body_end = None
+        self._headers = None
+        self._body = None
+        self._json = MISSING
+        self._message = None
+
+    @property
+    def headers(self):
+        """
+            Frame headers, unescaped.
+        """
+        if self._headers is None:
+            escaped = self.command not in UNESCAPED_COMMANDS
+            headers = {}
+            for line in self.raw[self._headers_start:self._body_start - 2].split('\n'):
+                name, separator, value = line.rstrip('\r').partition(':')
+                if not separator:
+                    continue
+                if escaped and '\\' in line:
+                    name = unescape_header(name)
+                    value = unescape_header(value)
+                # On repeated headers, only the first one is valid
+                if name not in headers:
+                    headers[name] = value
+            self._headers = headers
+        return self._headers
+
+    @property
+    def destination(self):
+        return self.headers.get('destination')
+
+    @property
+    def body_end(self):
+        """
+            End of the frame body, located using the content-length header when available.
+        """
+        if self._body_end is None:
+            raw = self.raw
+            length = len(raw)
+            body_start = self._body_start
+            body_end = -1
+
+            # Content-length counts octets, so only trust it if lands on the frame end,
+            # as the frame may have reached us already decoded
+            content_length = self.headers.get('content-length')
+            if content_length and content_length.isdigit():
+                body_end = body_start + int(content_length)
+                if body_end > length or (body_end < length and raw[body_end] != '\x00'):
+                    body_end = -1
+
+            if body_end == -1:
+                body_end = raw.find('\x00', body_start)
+                if body_end == -1:
+                    body_end = length
+
+            self._body_end = body_end
+        return self._body_end
+
+    @property
+    def body(self):
+        """
+            Frame body
+        """
+        if self._body is None:
+            self._body = self.raw[self._body_start:self.body_end]
+        return self._body
+
+    @property
+    def json(self):
+        """
+            Body decoded as json. Bodies that are not json are
+            interpreted as errors.
+        """
+        if self._json is MISSING:
+            raw = self.raw
+            body_end = self.body_end
+            if self._body_start == body_end:
+                self._json = self.body
+                return self._json
+            try:
+                start = WHITESPACE.match(raw, self._body_start, body_end).end()
+                self._json, end = jsoncodec.codec.decode(raw, start, body_end)
+                if end > body_end or WHITESPACE.match(raw, end, body_end).end() != body_end:
+                    raise ValueError('Extra data')
+            except ValueError:
+                raise stomp_error(self.body)
+        return self._json
+
+    @property
+    def message(self):
+        """
+            Body unpacked as a maxcarrot message.
+        """
+        if self._message is None:
+            self._message = RabbitMessage.unpack(self.json)
+        return self._message
+
+    def __repr__(self):
+        return 'StompMessage(command={!r}, headers={!r}, body={!r})'.format(self.command, self.headers, self.body)
+
+
+def metadata_version(name):
+    """
+        Returns the version found on the metadata of an installed distribution,
+        looking for its dist-info or egg-info on sys.path, or None if not found.
+    """
+    prefix = name.replace('-', '_').lower()
+    for path in sys.path:
+        try:
+            entries = os.listdir(path or '.')
+        except OSError:
+            continue
+        for entry in entries:
+            base, extension = os.path.splitext(entry)
+            if extension not in ('.dist-info', '.egg-info') or base.split('-')[0].lower() != prefix:
+                continue
+            metadata = os.path.join(path, entry)
+            if os.path.isdir(metadata):
+                metadata = os.path.join(metadata, 'METADATA' if extension == '.dist-info' else 'PKG-INFO')
+            try:
+                with open(metadata) as metadata_file:
+                    for line in metadata_file:
+                        if line.startswith('Version:'):
+                            return line.split(':', 1)[1].strip()
+            except IOError:
+                continue
+
+
+def distribution_version(name):
+    """
+        Returns the installed version of a distribution. pkg_resources is
+        only imported if there's no lighter way to get it, as it's slow to import.
+    """
+    # importlib.metadata, or its backport on python 2
+    for module in ('importlib.metadata', 'importlib_metadata'):
+        try:
+            return import_module(module).version(name)
+        except ImportError:
+            continue
+
+    version = metadata_version(name)
+    if version is None:
+        import pkg_resources
+        version = pkg_resources.get_distribution(name).version
+    return version
+
+
+def client_metadata():
+    """
+        Returns the client version and platform headers
+    """
+    global CLIENT_METADATA
+    if CLIENT_METADATA is None:
+        # Assigned once built, so concurrent callers never see it partially filled
+        CLIENT_METADATA = OrderedDict([
+            ("product-version", distribution_version('utalk-python-client')),
+            ("platform", 'Python {0.major}.{0.minor}.{0.micro}'.format(sys.version_info)),
+        ])
+    return CLIENT_METADATA
+
+
 def forge_message(command, headers, body=''):
     """
         Returns a STOMP compliant frame.
     """
     frame = Frame(command, headers, body)
     message = convert_frame_to_lines(frame)
-    return ''.join(message[:-1]) + '\u0000'
+    return ''.join(message)
 
 
 class StompHelper(object):
 
+    def __init__(self):
+        # CONNECT frames already built, indexed by its headers. Kept per
+        # helper and bounded, so tokens no longer used are discarded.
+        self.connect_frames = LRUCache(4)
+
     def decode(self, message):
         """
             Decodes the parts of a STOMP Frame.
-            Tries to decode the body as json.
+
+            Only the frame command is located here, the rest of the parts are
+            extracted when accessed, except on ERROR frames, that are raised
+            as exceptions if the body is not json.
         """
-        match = re.search(r'^(\w+)\n(.*?)\n\n(.*?)\x00?$', message, re.DOTALL)
-        if match is None:
+        # Skip heart-beat EOLs preceding the frame
+        start = 0
+        length = len(message)
+        while start < length and message[start] in '\r\n':
+            start += 1
+
+        command_end = message.find('\n', start)
+        headers_end = message.find('\n\n', command_end)
+        if command_end == -1 or headers_end == -1:
             raise Exception('Stomp decode error: {}'.format(message))
 
-        command, header, body = match.groups()
-        headers = dict(re.findall(r'\n?([^:]+):(.*)', header))
+        command = message[start:command_end].rstrip('\r')
+        stomp_message = StompMessage(message, command, command_end + 1, headers_end + 2)
 
-        try:
-            decoded_body = json.loads(body) if body else body
-            return StompMessage(command, body, decoded_body, headers)
-        except:
-            if 'Access refused' in body:
-                raise StompAccessDenied(body)
-            elif 'NOT_FOUND - no exchange' in body:
-                raise StompExchangeNotFound(body)
-            else:
-                raise StompError(body)
+        if command == 'ERROR':
+            # Force decoding, to raise non-json errors
+            stomp_message.json
+
+        return stomp_message
 
-    def connect_frame(self, login, passcode, **extra_headers):
+    def connect_frame(self, login, passcode, heart_beat=(0, 0), **extra_headers):
         """
-            Returns a STOMP CONNECT frame.
+            Returns a STOMP CONNECT frame, requesting the (outgoing, incoming)
+            heart-beat intervals in milliseconds.
         """
+        key = (login, passcode, heart_beat, tuple(sorted(extra_headers.items())))
+        message = self.connect_frames.get(key)
+        if message is not None:
+            return message
+
         headers = OrderedDict()
         headers["login"] = login
         headers["passcode"] = passcode
         headers["host"] = "/"
         headers["accept-version"] = "1.1,1.0"
-        headers["heart-beat"] = "0,0"
-        headers["product-version"] = pkg_resources.require('utalk-python-client')[0].version
-        headers["platform"] = 'Python {0.major}.{0.minor}.{0.micro}'.format(sys.version_info),
+        headers["heart-beat"] = "{},{}".format(*heart_beat)
+        headers.update(client_metadata())
 
         headers.update(extra_headers)
-        message = forge_message('CONNECT', headers)
+        message = self.connect_frames.set(key, forge_message('CONNECT', headers))
         return message
 
     def subscribe_frame(self, destination):
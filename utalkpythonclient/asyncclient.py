@@ -0,0 +1,120 @@
+from gevent import monkey
+from gevent.event import AsyncResult
+from gevent.queue import Empty
+from gevent.queue import Full
+from gevent.queue import Queue
+from utalkpythonclient.client import UTalkClient
+
+import gevent
+
+# Marks the end of the received messages on the inbox
+CLOSED = object()
+
+
+class AsyncUTalkClient(UTalkClient):
+    """
+        Cooperative utalk client running on gevent.
+
+        The transport listener runs on its own greenlet, so a single process can
+        host many connected clients without a thread each. Messages received are
+        queued on an inbox, to be consumed iterating the client:
+
+            client = AsyncUTalkClient(maxserver, username, password).open()
+            client.send_message(conversation, 'Hello')
+            for message in client:
+                print message.message['data']['text']
+
+        The websocket transport is cooperative by itself, xhr transports need
+        the sockets patched by gevent. Authentication uses blocking http requests,
+        so when sockets are not patched it's done on a thread of the gevent hub
+        pool, not to block the other greenlets.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+            Creates a client using gevent transports. Accepts the same arguments
+            as UTalkClient, plus the max number of messages held on the inbox.
+        """
+        inbox_size = kwargs.pop('inbox_size', None)
+        kwargs['use_gevent'] = True
+        super(AsyncUTalkClient, self).__init__(*args, **kwargs)
+
+        self.inbox = Queue(maxsize=inbox_size)
+        self.inbox_closed = False
+        self.listening = AsyncResult()
+        self.greenlet = None
+
+        self.bind('start_listening', self.listening.set)
+        self.bind('disconnect', self.close_inbox)
+
+    def open(self, timeout=None):
+        """
+            Starts the transport listener on a greenlet, and waits until
+            the client is listening for messages. Raises the error that
+            ended the listener, if it ended before listening.
+        """
+        if not self.prepared and not monkey.is_module_patched('socket'):
+            gevent.get_hub().threadpool.apply(self.prepare)
+
+        self.greenlet = gevent.spawn(self.start)
+        self.greenlet.link(self.listener_ended)
+        self.listening.get(timeout=timeout)
+        return self
+
+    def listener_ended(self, greenlet):
+        if not self.listening.ready():
+            self.listening.set_exception(greenlet.exception or IOError('Connection ended before listening'))
+        self.close_inbox()
+
+    def close(self, timeout=None):
+        """
+            Disconnects the client and waits for the listener to finish
+        """
+        self.disconnect()
+        if self.greenlet is not None:
+            self.greenlet.join(timeout=timeout)
+
+    def close_inbox(self):
+        """
+            Marks the end of the inbox, without blocking if it's full
+        """
+        self.inbox_closed = True
+        try:
+            self.inbox.put_nowait(CLOSED)
+        except Full:
+            # The mark is not needed, receive checks the flag once empty
+            pass
+
+    def process_message(self, stomp):
+        """
+            Handles the message as usual, and queues it on the inbox
+        """
+        super(AsyncUTalkClient, self).process_message(stomp)
+        self.inbox.put(stomp)
+
+    def receive(self, timeout=None):
+        """
+            Waits for the next message received. Returns None when the
+            client is closed or on timeout.
+        """
+        if self.inbox_closed and self.inbox.empty():
+            return None
+        try:
+            message = self.inbox.get(timeout=timeout)
+        except Empty:
+            return None
+        if message is CLOSED:
+            # Keep the mark for other consumers
+            self.close_inbox()
+            return None
+        return message
+
+    def __iter__(self):
+        """
+            Iterates the messages received until the client is closed
+        """
+        while True:
+            message = self.receive()
+            if message is None:
+                return
+            yield message
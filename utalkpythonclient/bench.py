@@ -0,0 +1,332 @@
+"""UTalk load benchmark
+
+Spawns a UTalk test client for each user on each conversation, waits until all
+of them are listening, and makes them send messages at the configured rate,
+reporting the throughput and latencies when all messages are received.
+
+Users on each conversation are named using the users pattern, numbered
+consecutively across conversations starting with 1.
+
+Clients can be distributed across several worker processes, to avoid the
+benchmark being limited by the cpu of a single process. All workers start
+sending at the same time, and their stats are merged on the report.
+
+Usage:
+    utalk-bench <maxserver> <conversation>... [options]
+
+Options:
+    -u <pattern>, --users <pattern>                 Pattern of the usernames, {} is replaced by the user number [default: user{}]
+    -p <password>, --password <password>            Password shared by all the users
+    -n <users>, --per-conversation <users>          Users on each conversation [default: 2]
+    -m <messages>, --messages <messages>            Messages sent by each user [default: 10]
+    -r <rate>, --rate <rate>                        Messages per second sent by each user, 0 for no limit [default: 1]
+    -f <profile>, --profile <profile>               Rate profile, can be constant, poisson, burst [default: constant]
+    -b <burst>, --burst <burst>                     Messages sent at once on the burst profile [default: 10]
+    -d <seconds>, --duration <seconds>              Max seconds to wait for the messages [default: 60]
+    -c <clients>, --concurrency <clients>           Max clients authenticating at the same time on each worker [default: 50]
+    -w <workers>, --workers <workers>               Worker processes running the clients [default: 1]
+    -t <transport>, --transport <transport>         Transport used, can be websocket, xhr, xhr_streaming [default: websocket]
+    -s <utalkserver>, --utalkserver <utalkserver>   Url of the sockjs endpoint
+"""
+
+from docopt import docopt
+from gevent import monkey
+from gevent.event import AsyncResult
+from gevent.pool import Pool
+from multiprocessing import Pipe
+from multiprocessing import Process
+from utalkpythonclient.stats import Stats
+
+import getpass
+import gevent
+import sys
+import time
+
+READY = 'ready'
+START = 'start'
+DONE = 'done'
+
+
+class StartBarrier(object):
+    """
+        Holds the test clients until all of them are listening.
+
+        Clients call ready() when listening, and wait for the event to be set,
+        with the time when the test starts. Clients that end without being
+        ready, as when failing to connect, call failed() to not hold the others.
+    """
+
+    def __init__(self, count):
+        self.count = count
+        self.waiting = 0
+        self.failures = 0
+        self.started = None
+        self.event = AsyncResult()
+
+    def ready(self):
+        self.waiting += 1
+        self.check()
+
+    def failed(self):
+        self.failures += 1
+        self.check()
+
+    def check(self):
+        # Counts grow one by one, so this is true only once
+        if self.waiting + self.failures == self.count:
+            self.all_ready()
+
+    def all_ready(self):
+        self.start(time.time())
+
+    def start(self, started):
+        self.started = started
+        self.event.set(started)
+
+
+class WorkerBarrier(StartBarrier):
+    """
+        Start barrier of a worker process.
+
+        When all the clients of the worker are ready, the parent process is
+        notified, and the clients are held until the parent sends the start time.
+    """
+
+    def __init__(self, count, connection):
+        super(WorkerBarrier, self).__init__(count)
+        self.connection = connection
+        self.notified = False
+        gevent.spawn(self.wait_start)
+
+    def all_ready(self):
+        # Notify once, even if more clients become ready later
+        if not self.notified:
+            self.notified = True
+            self.connection.send((READY, None))
+
+    def wait_start(self):
+        from gevent.socket import wait_read
+        wait_read(self.connection.fileno())
+        command, started = self.connection.recv()
+        self.start(started)
+
+
+def client_specs(arguments):
+    """
+        Returns the (username, conversation) pairs of the clients to spawn
+    """
+    per_conversation = int(arguments['--per-conversation'])
+    specs = []
+    for conversation_index, conversation in enumerate(arguments['<conversation>']):
+        for user_index in range(per_conversation):
+            number = conversation_index * per_conversation + user_index + 1
+            specs.append((arguments['--users'].format(number), conversation))
+    return specs
+
+
+def create_clients(arguments, password, specs, barrier):
+    """
+        Creates and configures the test clients, authenticating them concurrently.
+    """
+    # Imported here, as the client modules must be imported once sockets are patched
+    from utalkpythonclient.sessions import create_session
+    from utalkpythonclient.testclient import UTalkTestClient
+
+    messages = int(arguments['--messages'])
+    others = int(arguments['--per-conversation']) - 1
+    rate = float(arguments['--rate'])
+    concurrency = int(arguments['--concurrency'])
+
+    # Keep alive the connections of all the clients, as xhr clients have
+    # a poll and a send request in flight at the same time
+    session = create_session(pool_maxsize=max(2 * len(specs), concurrency))
+
+    # Fetch all the tokens at once, clients will find them cached
+    credentials = [(username, password) for username, conversation in specs]
+    UTalkTestClient.preauthenticate(arguments['<maxserver>'], credentials, session=session, concurrency=concurrency)
+
+    def create(spec):
+        username, conversation = spec
+        client = UTalkTestClient(
+            arguments['<maxserver>'], username, password,
+            quiet=True,
+            transport=arguments['--transport'],
+            use_gevent=True,
+            utalkserver=arguments['--utalkserver'],
+            session=session)
+        client.setup(
+            conversation, messages, others * messages, barrier,
+            message_delay=1.0 / rate if rate else 0,
+            profile=arguments['--profile'],
+            burst=int(arguments['--burst']))
+        return client
+
+    clients = [create(spec) for spec in specs]
+    Pool(concurrency).map(UTalkTestClient.prepare, clients)
+    return clients
+
+
+def run_clients(clients, barrier, duration):
+    """
+        Runs the clients until all of them succeed or the duration expires.
+        Returns the merged stats of all clients.
+    """
+    greenlets = []
+    for client in clients:
+        greenlet = gevent.spawn(client.start)
+        greenlet.link(lambda greenlet, client=client: client.listening or barrier.failed())
+        greenlets.append(greenlet)
+    gevent.joinall(greenlets, timeout=duration)
+
+    for client in clients:
+        if not client.succeded():
+            client.disconnect()
+    gevent.killall(greenlets, block=False)
+
+    stats = Stats()
+    for client in clients:
+        stats.merge(client.stats)
+    return stats
+
+
+def run_shard(arguments, password, specs, barrier):
+    """
+        Runs the clients of the specified users.
+        Returns the merged stats, the number of clients, the number of succeeded
+        ones and the number of failed ones, that never got to listen.
+    """
+    clients = create_clients(arguments, password, specs, barrier)
+    print '> Starting {} clients'.format(len(clients))
+    stats = run_clients(clients, barrier, float(arguments['--duration']))
+    succeeded = len([client for client in clients if client.succeded()])
+    failed = len([client for client in clients if not client.listening])
+    return stats, len(clients), succeeded, failed
+
+
+def run_worker(arguments, password, specs, connection):
+    """
+        Runs a shard of the clients on a worker process, and sends back the results.
+    """
+    monkey.patch_all()
+    barrier = WorkerBarrier(len(specs), connection)
+    connection.send((DONE, run_shard(arguments, password, specs, barrier)))
+
+
+def run_workers(arguments, password, specs, workers):
+    """
+        Distributes the clients across worker processes, and starts them at the same
+        time when all are ready, or when the duration expires.
+        Returns the merged stats, the start time, the number of clients, the
+        number of succeeded ones and the number of failed ones.
+    """
+    duration = float(arguments['--duration'])
+    processes = []
+    connections = []
+    for index in range(workers):
+        connection, worker_connection = Pipe()
+        process = Process(target=run_worker, args=(arguments, password, specs[index::workers], worker_connection))
+        process.daemon = True
+        process.start()
+        # Keep only the worker end open on the worker, so its death is seen as EOF
+        worker_connection.close()
+        processes.append(process)
+        connections.append(connection)
+
+    # Authenticating may take long, so wait for the workers to be ready
+    # at most the duration of the test after the first one is ready.
+    # Pipes are polled in turns, as any worker may be the first one.
+    results = [None] * workers
+    pending = range(workers)
+    deadline = None
+    while pending and (deadline is None or time.time() < deadline):
+        for index in list(pending):
+            if not connections[index].poll(0.1):
+                continue
+            pending.remove(index)
+            try:
+                command, payload = connections[index].recv()
+            except EOFError:
+                # Worker died before being ready
+                continue
+            if command == DONE:
+                # Worker finished without waiting to be started
+                results[index] = payload
+            deadline = deadline or time.time() + duration
+
+    started = time.time()
+    for connection in connections:
+        try:
+            connection.send((START, started))
+        except IOError:
+            # Worker already dead
+            pass
+
+    stats = Stats()
+    clients = succeeded = failed = 0
+    for index, connection in enumerate(connections):
+        try:
+            while results[index] is None:
+                command, payload = connection.recv()
+                # Skip the ready message of workers ready after the deadline
+                if command == DONE:
+                    results[index] = payload
+        except EOFError:
+            # Worker died without results
+            continue
+        worker_stats, worker_clients, worker_succeeded, worker_failed = results[index]
+        stats.merge(worker_stats)
+        clients += worker_clients
+        succeeded += worker_succeeded
+        failed += worker_failed
+
+    for process in processes:
+        process.join()
+
+    return stats, started, clients, succeeded, failed
+
+
+def report(stats, started, clients, succeeded, failed):
+    """
+        Prints the throughput and latencies of the test
+    """
+    received = stats['recv_times'] if 'recv_times' in stats else None
+    finished = received.last if received is not None and received.count else time.time()
+    elapsed = max(finished - started, 0.001) if started else 0
+
+    print
+    print '  Clients: {} ({} succeeded, {} failed to connect)'.format(clients, succeeded, failed)
+    if elapsed:
+        print '  Elapsed: {:.3f}s'.format(elapsed)
+        print '  Throughput: {:.1f} messages received/s'.format(received.count / elapsed if received is not None else 0)
+    print
+    for metric in stats.metrics.values():
+        print '  ' + metric.summary()
+    print
+
+
+def main(argv=sys.argv):
+
+    arguments = docopt(__doc__, version='UTalk load benchmark 1.0')
+
+    print
+    print "  UTalk load benchmark"
+    print
+
+    password = arguments.get('--password', None)
+    if not password:
+        print '> Enter password for the users'
+        password = getpass.getpass()
+
+    specs = client_specs(arguments)
+    workers = int(arguments['--workers'])
+
+    print '> Authenticating {} clients on {} workers'.format(len(specs), workers)
+    if workers > 1:
+        stats, started, clients, succeeded, failed = run_workers(arguments, password, specs, workers)
+    else:
+        monkey.patch_all()
+        barrier = StartBarrier(len(specs))
+        stats, clients, succeeded, failed = run_shard(arguments, password, specs, barrier)
+        started = barrier.started
+
+    report(stats, started, clients, succeeded, failed)
@@ -0,0 +1,89 @@
+import json
+import os
+import threading
+import time
+
+
+class TTLCache(object):
+    """
+        Thread safe cache whose entries expire `ttl` seconds after set.
+
+        If a path is given, entries are kept on a json file, so they
+        are shared between runs and processes.
+    """
+
+    def __init__(self, ttl, path=None, clock=time.time):
+        self.ttl = ttl
+        self.path = path
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as cache_file:
+                self.entries = json.load(cache_file)
+        except ValueError:
+            # Corrupt file, will be overwritten
+            self.entries = {}
+
+    def save(self):
+        if self.path is None:
+            return
+        # Write a private copy and replace the file, so readers never see a partial file
+        temporary = '{}.{}'.format(self.path, os.getpid())
+        descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+        with os.fdopen(descriptor, 'w') as cache_file:
+            json.dump(self.entries, cache_file)
+        os.rename(temporary, self.path)
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < self.clock():
+                del self.entries[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (self.clock() + self.ttl, value)
+            self.save()
+
+    def delete(self, key):
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.save()
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.save()
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+
+# Caches shared by all the clients of the process
+info_cache = TTLCache(300)
+token_cache = TTLCache(3600)
+
+
+def configure_caches(path=None, info_ttl=300, token_ttl=3600):
+    """
+        Replaces the shared caches of max info and tokens. If a directory
+        path is given, the caches are kept on files there.
+    """
+    global info_cache, token_cache
+    info_cache = TTLCache(info_ttl, path=path and os.path.join(path, 'info.json'))
+    token_cache = TTLCache(token_ttl, path=path and os.path.join(path, 'tokens.json'))
+
+
+def token_key(oauth_server, username):
+    return '{} {}'.format(oauth_server, username)
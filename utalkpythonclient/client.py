@@ -1,49 +1,102 @@
-import json
 import re
+import time
 
-from datetime import datetime
 from maxcarrot import RabbitMessage
 from utalkpythonclient._stomp import StompHelper
+from utalkpythonclient import jsoncodec
 
+from utalkpythonclient.heartbeat import Heartbeat
+from utalkpythonclient.heartbeat import get_timer_wheel
+from utalkpythonclient.heartbeat import negotiate
+from utalkpythonclient.heartbeat import parse_heart_beat
 from utalkpythonclient.mixins import MaxAuthMixin
+from utalkpythonclient.reconnect import ReconnectPolicy
+from utalkpythonclient.sessions import get_session
+from utalkpythonclient.stats import Stats
 from utalkpythonclient.transports import TRANSPORTS
+from utalkpythonclient.transports import get_transport_class
+from utalkpythonclient.utils import LRUCache
+from utalkpythonclient.utils import parse_timestamp
 from utalkpythonclient._stomp import StompAccessDenied
 from utalkpythonclient._stomp import StompExchangeNotFound
 from utalkpythonclient._stomp import StompError
 
+DESTINATION = re.compile(r'([0-9a-f]+).(?:notifications|messages)')
+
 
 class UTalkClient(object, MaxAuthMixin):
 
-    def __init__(self, maxserver, username, password=None, quiet=False, token_login=None, transport=None, use_gevent=False, utalkserver=None):
+    # Conversation ids parsed from message destinations, shared by all clients
+    destinations = LRUCache(4096)
+
+    # Number of the most recent latency samples kept on each stats metric
+    recent_samples = 0
+
+    # STOMP (outgoing, incoming) heart-beat intervals requested, in milliseconds
+    heart_beat = (10000, 10000)
+
+    def __init__(self, maxserver, username, password=None, quiet=False, token_login=None, transport=None, use_gevent=False, utalkserver=None, session=None, reconnect=None, heart_beat=None):
         """
-            Creates a utalk client fetching required info from the
-            max server.
+            Creates a utalk client. No requests are made until the client is
+            prepared, either explicitly or when connecting.
+
+            All http requests made by the client and its transport use the
+            provided requests session, or a shared one if none provided.
+
+            Lost connections are reconnected following the provided reconnect
+            policy, or a default ReconnectPolicy. Use reconnect=False to disable it.
+
+            Connections silent for longer than the negotiated heart-beats are
+            considered lost. Use heart_beat=(0, 0) to disable heart-beats.
         """
         self.quiet = quiet
-        max_info = self.get_max_info(maxserver)
-        oauth_server = max_info['max.oauth_server']
+        self.handlers = self.event_handlers()
+        self.session = get_session(session)
+        self.maxserver = maxserver
+        self.oauth_server = None
 
         self.domain = self.get_max_domain(maxserver)
         self.username = username
+        self.password = password
         self.login = username if self.domain is None else '{}:{}'.format(self.domain, username)
 
-        if token_login:
-            # Setup the provided token directly
-            self.token = token_login
-        else:
-            # Regular token login
-            self.token = self.get_token(oauth_server, username, password)
+        # Provided token is used directly, otherwise a token is retrieved on authenticate
+        self.token = token_login or None
 
         self.stomp = StompHelper()
         extra = {
-            "use_gevent": use_gevent
+            "use_gevent": use_gevent,
+            "session": self.session
         }
         if utalkserver:
             maxserver = utalkserver
 
-        self.transport = self.get_transport(transport, maxserver, 'stomp', **extra)
-        self.received = []
-        self.acknowledged = []
+        # Keep transport parameters to rebuild it on reconnections
+        self.transport_name = transport
+        self.transport_args = (maxserver, 'stomp')
+        self.transport_options = extra
+        self.transport = self.get_transport(transport, *self.transport_args, **extra)
+
+        self.reconnect_policy = ReconnectPolicy() if reconnect is None else (reconnect or None)
+        self.disconnecting = False
+        self.lost = None
+        self.listened = False
+
+        self.use_gevent = use_gevent
+        self.heart_beat = self.heart_beat if heart_beat is None else heart_beat
+        self.heartbeat = None
+
+        self.stats = Stats('received', 'acknowledged', 'downtime', recent=self.recent_samples)
+
+        # Encoded start and end of the SEND frames, indexed by conversation
+        self.send_templates = {}
+
+        # Handlers of maxcarrot messages, indexed by (action, object)
+        self.routes = {
+            ('add', 'message'): [self.handle_message_received],
+            ('add', 'conversation'): [self.handle_conversation_started],
+            ('ack', 'message'): [self.handle_message_ackd],
+        }
 
     @property
     def __client__(self):
@@ -56,7 +109,7 @@ class UTalkClient(object, MaxAuthMixin):
 
             Defaults to websocket transport
         """
-        transport_class = TRANSPORTS.get(transport, TRANSPORTS.get('websocket'))
+        transport_class = get_transport_class(transport if transport in TRANSPORTS else 'websocket')
         return transport_class(*args, **kwargs)
 
     def log(self, message):
@@ -69,43 +122,122 @@ class UTalkClient(object, MaxAuthMixin):
             except:
                 pass
 
-    def trigger(self, event, *args, **kwargs):
+    def event_handlers(self):
         """
-            Tries to call a method binded to an event, when defined by a subclass.
+            Collects the methods binded to events, when defined by a subclass.
             The methods MUST be named as the event, prefixed with on_
         """
-        event_handler_name = 'on_{}'.format(event)
-        if hasattr(self, event_handler_name):
-            getattr(self, event_handler_name)(*args, **kwargs)
+        handlers = {}
+        for name in dir(self.__class__):
+            if name.startswith('on_') and callable(getattr(self.__class__, name)):
+                handlers[name[3:]] = [getattr(self, name)]
+        return handlers
+
+    def bind(self, event, handler):
+        """
+            Adds a handler to be called when an event is triggered
+        """
+        # Lists are replaced, not modified, so handlers can bind or unbind
+        # while the event is being triggered
+        self.handlers[event] = self.handlers.get(event, []) + [handler]
+
+    def unbind(self, event, handler):
+        """
+            Removes a handler previously binded to an event
+        """
+        handlers = [binded for binded in self.handlers.get(event, []) if binded != handler]
+        if handlers:
+            self.handlers[event] = handlers
+        else:
+            self.handlers.pop(event, None)
+
+    def trigger(self, event, *args, **kwargs):
+        """
+            Calls the handlers binded to an event, if any.
+        """
+        handlers = self.handlers.get(event)
+        if handlers:
+            for handler in handlers:
+                handler(*args, **kwargs)
 
     def send(self, message):
         """
             Sends a message trough the transport
         """
+        if self.heartbeat is not None:
+            self.heartbeat.sent()
         self.transport.send(message)
 
+    def flush(self):
+        """
+            Sends the messages queued on the transport, when batching
+        """
+        self.transport.flush()
+
+    def authenticate(self):
+        """
+            Fetches the max server info, and the user token if no token
+            was provided. Can be retried if fails.
+        """
+        max_info = self.get_max_info(self.maxserver, session=self.session)
+        self.oauth_server = max_info['max.oauth_server']
+        if self.token is None:
+            self.token = self.get_token(self.oauth_server, self.username, self.password, session=self.session)
+
+    @property
+    def prepared(self):
+        return self.oauth_server is not None and self.token is not None
+
+    def prepare(self):
+        """
+            Makes the client ready to connect, authenticating it if not yet.
+            Clients can be prepared concurrently, before starting them.
+        """
+        if not self.prepared:
+            self.authenticate()
+        return self
+
+    @property
+    def managed(self):
+        """
+            Tells if the transport is listened by a connection manager
+        """
+        return getattr(self.transport, 'manager', None) is not None
+
     def start(self):
         """
-            Starts the transport listener
+            Starts the transport listener. Lost connections are reconnected,
+            until disconnected, following the reconnect policy.
         """
+        self.disconnecting = False
         try:
-            self.connect()
-            self.transport.start()
+            try:
+                self.connect()
+            except Exception as exc:
+                # A failed first connection is retried as a lost one
+                if self.reconnect_policy is None:
+                    raise
+                self.log('Connection failed: {!r}'.format(exc))
+                if not self.reconnect():
+                    return self
+            self.listen()
+
+            # Managed transports don't block while listening, so they are
+            # reconnected when closed.
+            while not self.managed and self.reconnect():
+                self.listen()
         except KeyboardInterrupt:
             self.log('\n> User interrupted')
             self.disconnect()
-            total_messages = len(self.received)
-            average_recv_time = sum([a[1] for a in self.received]) / total_messages if total_messages else 0
-            total_acks = len(self.acknowledged)
-            average_ackd_time = sum([a[1] for a in self.acknowledged]) / total_acks if total_acks else 0
-            self.log('Received {} messages, average reception time: {:.3f}'.format(total_messages, average_recv_time))
-            self.log('Acknowledged {} messages, average acknowledge time: {:.3f}'.format(total_messages, average_ackd_time))
+            for metric in self.stats.metrics.values():
+                self.log(metric.summary())
         return self
 
     def connect(self):
         """
             Initializes the transport bindings and connection
         """
+        self.prepare()
         self.trigger('connecting')
         self.transport.bind(
             on_open=self.handle_open,
@@ -115,10 +247,107 @@ class UTalkClient(object, MaxAuthMixin):
         )
         self.transport.connect()
 
+    def listen(self):
+        """
+            Runs the transport listener until the connection ends. Errors
+            while listening mean the connection was lost.
+        """
+        try:
+            self.transport.start()
+        except Exception as exc:
+            self.log('Lost {} connection: {!r}'.format(self.transport.transport_id, exc))
+
+    def rebuild_transport(self):
+        """
+            Replaces the transport by a new one with the same parameters
+            and configuration.
+        """
+        previous = self.transport
+        self.transport = self.get_transport(self.transport_name, *self.transport_args, **self.transport_options)
+        if getattr(previous, 'manager', None) is not None:
+            self.transport.manager = previous.manager
+        if previous.batching:
+            self.transport.configure_batching(previous.batch_window, previous.batch_size, previous.batch_bytes)
+
+    def reconnect(self):
+        """
+            Connects again using a new transport after the connection is lost,
+            waiting between attempts as the reconnect policy says. The STOMP
+            session and subscription are restored when the new transport opens.
+
+            Returns False if the client was disconnected or the policy gave up.
+        """
+        if self.disconnecting or self.reconnect_policy is None:
+            return False
+
+        self.stop_heartbeat()
+        self.lost = self.lost or time.time()
+        while True:
+            delay = self.reconnect_delay()
+            if delay is None:
+                return False
+
+            self.transport.sleep(delay)
+            if self.reconnect_attempt():
+                return True
+            if self.disconnecting:
+                return False
+
+    def reconnect_later(self):
+        """
+            Reconnects without blocking, as reconnect() does, waiting between
+            attempts on the shared timer wheel instead of on a thread of its own.
+            Attempts run on the wheel, so they should be quick, as with managed
+            websocket connections.
+        """
+        if self.disconnecting or self.reconnect_policy is None:
+            return
+
+        self.stop_heartbeat()
+        self.lost = self.lost or time.time()
+        delay = self.reconnect_delay()
+        if delay is not None:
+            get_timer_wheel(self.use_gevent).schedule(delay, self.reconnect_later_attempt)
+
+    def reconnect_later_attempt(self):
+        if not self.reconnect_attempt():
+            self.reconnect_later()
+
+    def reconnect_delay(self):
+        """
+            Counts a failed connection, returning the seconds to wait before
+            trying again, or None if the reconnect policy gave up.
+        """
+        self.reconnect_policy.failed()
+        delay = self.reconnect_policy.next_delay()
+        if delay is None:
+            self.log('Giving up reconnecting after {} attempts'.format(self.reconnect_policy.failures))
+        else:
+            self.log('Reconnecting in {:.1f} seconds'.format(delay))
+        return delay
+
+    def reconnect_attempt(self):
+        """
+            Connects a new transport, returning True if connected
+        """
+        if self.disconnecting:
+            return False
+
+        self.rebuild_transport()
+        self.trigger('reconnecting')
+        try:
+            self.connect()
+            return True
+        except Exception as exc:
+            self.log('Reconnection failed: {}'.format(exc))
+            return False
+
     def disconnect(self):
         """
             Terminates transport connection
         """
+        self.disconnecting = True
+        self.stop_heartbeat()
         self.log('Closing communication')
         self.transport.close()
         self.trigger('disconnect')
@@ -137,42 +366,102 @@ class UTalkClient(object, MaxAuthMixin):
         if self.domain:
             message['domain'] = self.domain
 
-        headers = {
-            "destination": "/exchange/{}.publish/{}.messages".format(self.username, conversation),
-        }
-        # Convert json to text without blank space, and escape it
-        json_message = json.dumps(message.packed, separators=(',', ':'))
-        json_message = json_message.replace('"', '\\"')
+        # Convert json to text without blank space, and encode it to be
+        # embedded on the already encoded frame
+        json_message = jsoncodec.codec.dumps(message.packed)
+        prefix, suffix = self.send_template(conversation)
 
-        self.send(self.stomp.send_frame(headers, json_message))
+        if self.heartbeat is not None:
+            self.heartbeat.sent()
+        self.transport.send_encoded(''.join((prefix, self.transport.encode(json_message)[1:-1], suffix)))
         self.trigger('message_sent')
 
+    def send_template(self, conversation):
+        """
+            Returns the start and the end of the SEND frames to a conversation,
+            already encoded for the transport, to be completed with the body.
+        """
+        template = self.send_templates.get(conversation)
+        if template is None:
+            headers = {
+                "destination": "/exchange/{}.publish/{}.messages".format(self.username, conversation),
+            }
+            frame = self.transport.encode(self.stomp.send_frame(headers, ''))
+            # Split the encoded frame at the encoded \x00 terminator
+            end = frame.rindex('\\u0000')
+            template = self.send_templates[conversation] = (frame[:end], frame[end:])
+        return template
+
+    def add_route(self, action, object_type, handler):
+        """
+            Registers a handler for the maxcarrot messages with the
+            specified action and object. The handler will be called with
+            the stomp message, the maxcarrot message and the conversation id.
+        """
+        # Lists are replaced, not modified, as with event handlers
+        key = (action, object_type)
+        self.routes[key] = self.routes.get(key, []) + [handler]
+
+    def remove_route(self, action, object_type, handler):
+        """
+            Unregisters a handler added with add_route
+        """
+        key = (action, object_type)
+        handlers = [routed for routed in self.routes.get(key, []) if routed != handler]
+        if handlers:
+            self.routes[key] = handlers
+        else:
+            self.routes.pop(key, None)
+
+    def parse_destination(self, destination):
+        """
+            Extracts the conversation id from a message destination.
+        """
+        conversation = self.destinations.get(destination)
+        if conversation is None:
+            match = DESTINATION.search(destination)
+            conversation = self.destinations.set(destination, match.groups()[0] if match else '')
+        return conversation
+
     def process_message(self, stomp):
         """
             Handle a decoded stomp message.
             We're assuming that stomp messages will ever contain a MaxCarrot message.
-            Based on properties fn the latter, we'll execute proper actions.
-        """
-        message = RabbitMessage.unpack(stomp.json)
-        destination = re.search(r'([0-9a-f]+).(?:notifications|messages)', stomp.headers['destination']).groups()[0]
-        if message['action'] == 'add' and message['object'] == 'message':
-            sent = datetime.strptime(message['published'], '%Y-%m-%dT%H:%M:%S.%fZ')
-            recv = datetime.utcnow()
-            elapsed = abs((recv - sent).total_seconds())
-            self.received.append((message, elapsed))
-            #self.log('{}@{} ({:.3f}): {}'.format(message['user']['username'], destination, elapsed, message['data']['text']))
-            self.trigger('message_received', stomp)
-        elif message['action'] == 'add' and message['object'] == 'conversation':
-            self.log('{}@{}: Just started a chat'.format(message['user']['username'], destination))
-            self.trigger('conversation_started', stomp)
-        elif message['action'] == 'ack' and message['object'] == 'message':
-            sent = datetime.strptime(message['published'], '%Y-%m-%dT%H:%M:%S.%fZ')
-            recv = datetime.utcnow()
-            elapsed = abs((recv - sent).total_seconds())
-            self.acknowledged.append((message, elapsed))
-            self.trigger('message_ackd', stomp)
-        else:
+            Based on properties fn the latter, we'll execute the handlers routed.
+        """
+        message = stomp.message
+        handlers = self.routes.get((message['action'], message['object']))
+        if not handlers:
             print '\n{}\n'.format(message)
+            return
+
+        conversation = self.parse_destination(stomp.destination)
+        for handler in handlers:
+            handler(stomp, message, conversation)
+
+    def handle_message_received(self, stomp, message, conversation):
+        """
+            Routed when a message is received on a conversation
+        """
+        elapsed = abs(time.time() - parse_timestamp(message['published']))
+        self.stats.add('received', elapsed)
+        #self.log('{}@{} ({:.3f}): {}'.format(message['user']['username'], conversation, elapsed, message['data']['text']))
+        self.trigger('message_received', stomp)
+
+    def handle_conversation_started(self, stomp, message, conversation):
+        """
+            Routed when a conversation is started
+        """
+        self.log('{}@{}: Just started a chat'.format(message['user']['username'], conversation))
+        self.trigger('conversation_started', stomp)
+
+    def handle_message_ackd(self, stomp, message, conversation):
+        """
+            Routed when a message is acknowledged by the server
+        """
+        elapsed = abs(time.time() - parse_timestamp(message['published']))
+        self.stats.add('acknowledged', elapsed)
+        self.trigger('message_ackd', stomp)
 
     def handle_open(self):
         """
@@ -180,7 +469,7 @@ class UTalkClient(object, MaxAuthMixin):
             Tries to initialize the stomp session.
         """
         self.log('Opened {} connection to {}'.format(self.transport.transport_id, self.transport.url))
-        self.send(self.stomp.connect_frame(self.login, self.token, **{"product": self.__client__}))
+        self.send(self.stomp.connect_frame(self.login, self.token, heart_beat=self.heart_beat, **{"product": self.__client__}))
         self.log('Starting STOMP session as {}'.format(self.username))
 
     def handle_message(self, message):
@@ -188,13 +477,25 @@ class UTalkClient(object, MaxAuthMixin):
             Triggered by the transport when a message arrives
             Executes actions based on the stomp command in the message
         """
+        if self.heartbeat is not None:
+            self.heartbeat.received()
+
+        if not message.content.strip('\r\n'):
+            # STOMP heart-beat
+            return
+
         self.trigger('message')
 
         try:
             stomp_message = self.stomp.decode(message.content)
         except StompAccessDenied as exc:
+            # Close and let the reconnect policy decide when to try again
             self.log(exc.message)
-            self.send(self.stomp.connect_frame(self.login, self.token, **{"product": self.__client__}))
+            self.forget_token(self.oauth_server, self.username)
+            if self.password:
+                # Get a new token when reconnecting
+                self.token = None
+            self.transport.close()
             return
         except StompExchangeNotFound as exc:
             self.log(exc.message)
@@ -207,13 +508,30 @@ class UTalkClient(object, MaxAuthMixin):
 
         if stomp_message.command == 'CONNECTED':
             self.log('STOMP Session succesfully started')
+            if self.reconnect_policy is not None:
+                self.reconnect_policy.succeeded()
+            if self.lost is not None:
+                self.stats.add('downtime', time.time() - self.lost)
+                self.lost = None
+            self.start_heartbeat(stomp_message.headers.get('heart-beat'))
             destination = "/exchange/{}.subscribe".format(self.username)
             self.send(self.stomp.subscribe_frame(destination))
             self.log('Listening on {} messages'.format(self.username))
-            self.trigger('start_listening')
+
+            # Handlers of the first session aren't run again on reconnections
+            if self.listened:
+                self.trigger('reconnected')
+            else:
+                self.listened = True
+                self.trigger('start_listening')
 
         elif stomp_message.command == 'MESSAGE':
-            self.process_message(stomp_message)
+            try:
+                self.process_message(stomp_message)
+            except StompError as exc:
+                # Message body couldn't be decoded
+                self.log(exc.message)
+                self.disconnect()
 
         elif stomp_message.command == 'ERROR':
             self.log(message.content)
@@ -225,10 +543,49 @@ class UTalkClient(object, MaxAuthMixin):
         """
             Triggered by the transport when a heartbeat  is received
         """
+        if self.heartbeat is not None:
+            self.heartbeat.received()
         self.log("> Ping!")
 
+    def start_heartbeat(self, server_heart_beat):
+        """
+            Starts sending and checking STOMP heart-beats, with the intervals
+            negotiated with the server.
+        """
+        self.stop_heartbeat()
+        outgoing, incoming = negotiate(self.heart_beat, parse_heart_beat(server_heart_beat))
+        if outgoing or incoming:
+            self.heartbeat = Heartbeat(
+                self.send_heartbeat, self.handle_dead_connection,
+                outgoing, incoming,
+                wheel=get_timer_wheel(self.use_gevent)).start()
+
+    def stop_heartbeat(self):
+        if self.heartbeat is not None:
+            self.heartbeat.stop()
+            self.heartbeat = None
+
+    def send_heartbeat(self):
+        self.transport.send('\n')
+
+    def handle_dead_connection(self):
+        """
+            Triggered when nothing is received for longer than the heart-beats.
+            Drops the connection, so it's reconnected without waiting for the
+            socket to time out.
+        """
+        self.log('No heart-beats received, dropping {} connection'.format(self.transport.transport_id))
+        self.heartbeat = None
+        self.trigger('connection_lost')
+        self.transport.abort()
+
     def handle_close(self, reason):
         """
             Triggered by the transport when a close
         """
         self.log('Closed {} connection. Reason: {}'.format(self.transport.transport_id, reason))
+        self.stop_heartbeat()
+
+        # Blocking transports are reconnected when they stop listening
+        if self.managed:
+            self.reconnect_later()
@@ -0,0 +1,200 @@
+import threading
+import time
+
+# Timer wheels shared by all the clients of the process, by mode
+shared_wheels = {}
+
+
+class Timer(object):
+    """
+        Callback scheduled on a timer wheel, every `interval` seconds
+        if repeating.
+    """
+
+    __slots__ = ('interval', 'callback', 'repeat', 'rounds', 'cancelled')
+
+    def __init__(self, interval, callback, repeat=False):
+        self.interval = interval
+        self.callback = callback
+        self.repeat = repeat
+        self.rounds = 0
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel(object):
+    """
+        Hashed timer wheel, firing the timers of many clients from a single
+        thread, or greenlet on gevent mode.
+
+        Timers are placed on the slot where they expire, and on each tick only
+        the timers on the current slot are visited. Timers expiring after a full
+        turn of the wheel wait for as many rounds. Timers fire with a precision
+        of `tick` seconds.
+    """
+
+    def __init__(self, tick=0.1, size=512, use_gevent=False):
+        self.tick = tick
+        self.size = size
+        self.use_gevent = use_gevent
+        self.slots = [[] for index in range(size)]
+        self.position = 0
+        self.lock = threading.Lock()
+        self.running = False
+
+    def schedule(self, interval, callback, repeat=False):
+        """
+            Calls back after `interval` seconds, and every `interval` seconds
+            if repeat. Returns the timer, that can be cancelled.
+        """
+        timer = Timer(interval, callback, repeat)
+        self.add(timer)
+        if not self.running:
+            self.start()
+        return timer
+
+    def add(self, timer):
+        ticks = max(int(round(timer.interval / self.tick)), 1)
+        with self.lock:
+            timer.rounds = (ticks - 1) // self.size
+            self.slots[(self.position + ticks) % self.size].append(timer)
+
+    def advance(self):
+        """
+            Moves to the next slot, firing its expired timers
+        """
+        with self.lock:
+            self.position = (self.position + 1) % self.size
+            slot = self.slots[self.position]
+            expired = [timer for timer in slot if not timer.cancelled and not timer.rounds]
+            self.slots[self.position] = [timer for timer in slot if not timer.cancelled and timer.rounds]
+            for timer in self.slots[self.position]:
+                timer.rounds -= 1
+
+        for timer in expired:
+            if timer.repeat:
+                self.add(timer)
+            # A failing timer must not stop the timers of other clients
+            try:
+                timer.callback()
+            except Exception as exc:
+                print '> Timer {!r} failed: {!r}'.format(timer.callback, exc)
+
+    def run(self):
+        """
+            Ticks the wheel, compensating the time spent firing timers
+        """
+        next_tick = time.time()
+        try:
+            while self.running:
+                next_tick += self.tick
+                self.sleep(max(next_tick - time.time(), 0))
+                self.advance()
+        finally:
+            # Let the next scheduled timer start the wheel again
+            self.running = False
+
+    def sleep(self, seconds):
+        if self.use_gevent:
+            import gevent
+            gevent.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    def start(self):
+        self.running = True
+        if self.use_gevent:
+            import gevent
+            gevent.spawn(self.run)
+        else:
+            thread = threading.Thread(target=self.run)
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        self.running = False
+
+
+def get_timer_wheel(use_gevent=False):
+    """
+        Returns the timer wheel shared by all the clients, on gevent or
+        threading mode.
+    """
+    wheel = shared_wheels.get(use_gevent)
+    if wheel is None:
+        wheel = shared_wheels[use_gevent] = TimerWheel(use_gevent=use_gevent)
+    return wheel
+
+
+def negotiate(client, server):
+    """
+        Returns the (outgoing, incoming) heart-beat intervals in milliseconds
+        agreed from the client and server heart-beat headers, 0 meaning none.
+    """
+    client_send, client_receive = client
+    server_send, server_receive = server
+    outgoing = max(client_send, server_receive) if client_send and server_receive else 0
+    incoming = max(client_receive, server_send) if client_receive and server_send else 0
+    return outgoing, incoming
+
+
+def parse_heart_beat(value):
+    """
+        Parses a STOMP heart-beat header into a pair of milliseconds
+    """
+    if not value:
+        return 0, 0
+    send, receive = value.split(',')
+    return int(send), int(receive)
+
+
+class Heartbeat(object):
+    """
+        Keeps the STOMP heart-beats of a connection.
+
+        Sends a beat when nothing was sent during the outgoing interval, and
+        flags the connection as dead when nothing is received during the
+        incoming interval times `tolerance`.
+    """
+
+    def __init__(self, send, dead, outgoing, incoming, tolerance=2.0, wheel=None, clock=time.time):
+        self.send = send
+        self.dead = dead
+        self.outgoing = outgoing / 1000.0
+        self.incoming = incoming / 1000.0
+        self.tolerance = tolerance
+        self.wheel = wheel or get_timer_wheel()
+        self.clock = clock
+
+        self.last_sent = self.last_received = clock()
+        self.timers = []
+
+    def start(self):
+        if self.outgoing:
+            self.timers.append(self.wheel.schedule(self.outgoing / 2, self.check_outgoing, repeat=True))
+        if self.incoming:
+            self.timers.append(self.wheel.schedule(self.incoming, self.check_incoming, repeat=True))
+        return self
+
+    def stop(self):
+        for timer in self.timers:
+            timer.cancel()
+        self.timers = []
+
+    def sent(self):
+        self.last_sent = self.clock()
+
+    def received(self):
+        self.last_received = self.clock()
+
+    def check_outgoing(self):
+        if self.clock() - self.last_sent >= self.outgoing / 2:
+            self.sent()
+            self.send()
+
+    def check_incoming(self):
+        if self.clock() - self.last_received > self.incoming * self.tolerance:
+            self.stop()
+            self.dead()
@@ -0,0 +1,85 @@
+from collections import OrderedDict
+
+import json
+
+
+class JSONCodec(object):
+    """
+        Encoding and decoding functions of a json library.
+
+        Values are encoded compactly, without spaces. Libraries able to decode
+        a value found at an offset do it in place, without slicing the data.
+    """
+
+    def __init__(self, name, loads, dumps, raw_decode=None):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+        self.raw_decode = raw_decode
+
+    def decode(self, data, start=0, end=None):
+        """
+            Decodes the json value starting at data[start], ending at most at
+            `end`. Returns the value and the position where it ends.
+        """
+        if self.raw_decode is not None:
+            return self.raw_decode(data, start)
+        end = len(data) if end is None else end
+        return self.loads(data[start:end]), end
+
+    def __repr__(self):
+        return 'JSONCodec({!r})'.format(self.name)
+
+
+def ujson_codec():
+    import ujson
+    return JSONCodec('ujson', ujson.loads, ujson.dumps)
+
+
+def simplejson_codec():
+    import simplejson
+    decoder = simplejson.JSONDecoder()
+    encoder = simplejson.JSONEncoder(separators=(',', ':'))
+    return JSONCodec('simplejson', simplejson.loads, encoder.encode, decoder.raw_decode)
+
+
+def json_codec():
+    decoder = json.JSONDecoder()
+    encoder = json.JSONEncoder(separators=(',', ':'))
+    return JSONCodec('json', json.loads, encoder.encode, decoder.raw_decode)
+
+
+# Available codecs, by order of preference
+CODECS = OrderedDict([
+    ('ujson', ujson_codec),
+    ('simplejson', simplejson_codec),
+    ('json', json_codec),
+])
+
+
+def get_codec(name=None):
+    """
+        Returns the codec of the named library, or of the fastest
+        library installed if no name given.
+    """
+    if name is not None:
+        return CODECS[name]()
+
+    for factory in CODECS.values():
+        try:
+            return factory()
+        except ImportError:
+            continue
+
+
+# Codec used by the clients and transports
+codec = get_codec()
+
+
+def use_codec(name):
+    """
+        Changes the codec used by all the clients and transports
+    """
+    global codec
+    codec = get_codec(name)
+    return codec
@@ -0,0 +1,66 @@
+from utalkpythonclient.websocket import WebsocketTransport
+from ws4py.manager import WebSocketManager
+
+import time
+
+
+class ConnectionManager(object):
+    """
+        Multiplexes the websocket connections of many clients.
+
+        Instead of a thread for each client, the sockets of all the clients
+        connected trough the manager are registered on a single poller (epoll
+        when available), and a single thread reads from the sockets with data,
+        dispatching the frames to the handlers of their clients.
+
+            manager = ConnectionManager()
+            for client in clients:
+                manager.connect(client)
+            manager.run_forever()
+
+        Handlers run on the manager thread, so they shouldn't block, or all
+        the other clients will be blocked too.
+    """
+
+    def __init__(self, poller=None):
+        self.websockets = WebSocketManager(poller=poller)
+        self.websockets.daemon = True
+
+    def __len__(self):
+        return len(self.websockets)
+
+    def connect(self, client):
+        """
+            Connects a client with a websocket transport trough the manager.
+        """
+        if not isinstance(client.transport, WebsocketTransport):
+            raise ValueError('Only websocket transports can be managed, not {}'.format(client.transport.transport_id))
+
+        client.transport.manager = self
+        client.start()
+        return client
+
+    def register(self, ws):
+        """
+            Starts listening on the socket of a connected websocket
+        """
+        if not self.websockets.is_alive():
+            self.websockets.start()
+        self.websockets.add(ws)
+
+    def run_forever(self, interval=0.1):
+        """
+            Blocks until all the managed connections are closed
+        """
+        try:
+            while len(self.websockets):
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            self.close()
+
+    def close(self):
+        """
+            Closes all the managed connections and stops the manager thread
+        """
+        self.websockets.close_all()
+        self.websockets.stop()
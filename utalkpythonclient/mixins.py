@@ -1,6 +1,8 @@
-import json
+from utalkpythonclient import cache
+from utalkpythonclient import jsoncodec
+from utalkpythonclient.sessions import get_session
+
 import re
-import requests
 import urlparse
 
 
@@ -22,20 +24,28 @@ class MaxAuthMixin():
         return headers
 
     @staticmethod
-    def get_max_info(maxserver):
+    def get_max_info(maxserver, session=None, cached=True):
         """
             Returns the public info bits from a maxserver.
+
+            Info is cached for all the clients of the process, unless
+            cached is False.
         """
-        response = requests.get('{}/info'.format(maxserver), verify=False)
+        info = cache.info_cache.get(maxserver) if cached else None
+        if info is not None:
+            return info
+
+        response = get_session(session).get('{}/info'.format(maxserver), verify=False)
         info = response.json()
+        cache.info_cache.set(maxserver, info)
         return info
 
     @classmethod
-    def get_max_settings(cls, maxserver, username, token):
+    def get_max_settings(cls, maxserver, username, token, session=None):
         """
             Returns the (private) settings from a maxserver.
         """
-        response = requests.get(
+        response = get_session(session).get(
             '{}/info/settings'.format(maxserver),
             headers=cls.oauth2_headers(username, token),
             verify=False)
@@ -53,10 +63,17 @@ class MaxAuthMixin():
         return domain
 
     @classmethod
-    def get_token(cls, oauth_server, username, password):
+    def get_token(cls, oauth_server, username, password, session=None, cached=True):
         """
             Retrieves the token for an authenticated user.
+
+            Tokens are cached for all the clients of the process, unless
+            cached is False.
         """
+        key = cache.token_key(oauth_server, username)
+        token = cache.token_cache.get(key) if cached else None
+        if token is not None:
+            return token
 
         payload = {
             "grant_type": 'password',
@@ -65,8 +82,8 @@ class MaxAuthMixin():
             "username": username,
             "password": password
         }
-        resp = requests.post('{0}/token'.format(oauth_server), data=payload, verify=False)
-        response = json.loads(resp.text)
+        resp = get_session(session).post('{0}/token'.format(oauth_server), data=payload, verify=False)
+        response = jsoncodec.codec.loads(resp.text)
 
         if resp.status_code == 200:
             # Get token, falling back to legacy oauth server
@@ -77,7 +94,48 @@ class MaxAuthMixin():
                     None
                 )
             )
+            if token is not None:
+                cache.token_cache.set(key, token)
             return token
 
         elif resp.status_code in [400, 401]:
             raise Exception('{error}: {error_description}'.format(**response))
+
+    @staticmethod
+    def forget_token(oauth_server, username):
+        """
+            Removes a rejected token from the cache.
+        """
+        cache.token_cache.delete(cache.token_key(oauth_server, username))
+
+    @classmethod
+    def get_tokens(cls, oauth_server, credentials, session=None, concurrency=20):
+        """
+            Retrieves the tokens of many users concurrently, given their
+            (username, password) pairs. Returns the tokens by username,
+            None for users that couldn't be authenticated.
+        """
+        from multiprocessing.dummy import Pool
+
+        def get_token(credential):
+            username, password = credential
+            try:
+                return cls.get_token(oauth_server, username, password, session=session)
+            except Exception:
+                return None
+
+        pool = Pool(max(min(concurrency, len(credentials)), 1))
+        try:
+            tokens = pool.map(get_token, credentials)
+        finally:
+            pool.close()
+        return dict(zip([username for username, password in credentials], tokens))
+
+    @classmethod
+    def preauthenticate(cls, maxserver, credentials, session=None, concurrency=20):
+        """
+            Fills the caches with the max info and the tokens of many users,
+            so clients created later don't wait for them.
+        """
+        oauth_server = cls.get_max_info(maxserver, session=session)['max.oauth_server']
+        return cls.get_tokens(oauth_server, credentials, session=session, concurrency=concurrency)
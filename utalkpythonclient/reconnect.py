@@ -0,0 +1,79 @@
+import random
+import time
+
+# Circuit breaker states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class ReconnectPolicy(object):
+    """
+        Decides when to reconnect after a connection is lost.
+
+        Waits grow exponentially with each consecutive failure, from `initial`
+        up to `maximum` seconds, with a random jitter so clients disconnected at
+        the same time don't reconnect at the same time.
+
+        After `threshold` consecutive failures the circuit opens, and no attempt
+        is made until `cooldown` seconds later. Then a single attempt is made
+        (half-open): if it succeeds the circuit closes, otherwise it opens again.
+
+        After `max_attempts` consecutive failures, if set, no more attempts are made.
+    """
+
+    def __init__(self, initial=0.5, maximum=30.0, multiplier=2.0, jitter=True,
+                 max_attempts=None, threshold=10, cooldown=60.0, clock=time.time):
+        self.initial = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.max_attempts = max_attempts
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+
+        self.failures = 0
+        self.state = CLOSED
+        self.opened = None
+
+    def failed(self):
+        """
+            Accounts a failed or lost connection
+        """
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.threshold and self.failures >= self.threshold):
+            self.state = OPEN
+            self.opened = self.clock()
+
+    def succeeded(self):
+        """
+            Accounts a succesful connection
+        """
+        self.failures = 0
+        self.state = CLOSED
+        self.opened = None
+
+    def backoff(self):
+        """
+            Seconds to wait after the current number of failures
+        """
+        delay = min(self.maximum, self.initial * self.multiplier ** max(self.failures - 1, 0))
+        if self.jitter:
+            # Keep at least half of the delay, randomize the rest
+            delay = delay / 2 + random.uniform(0, delay / 2)
+        return delay
+
+    def next_delay(self):
+        """
+            Returns the seconds to wait before the next attempt, or
+            None if no more attempts should be made.
+        """
+        if self.max_attempts is not None and self.failures > self.max_attempts:
+            return None
+
+        delay = self.backoff()
+        if self.state == OPEN:
+            delay = max(delay, self.opened + self.cooldown - self.clock())
+            self.state = HALF_OPEN
+        return delay
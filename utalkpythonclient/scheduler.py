@@ -0,0 +1,92 @@
+import random
+import time
+
+CONSTANT = 'constant'
+POISSON = 'poisson'
+BURST = 'burst'
+
+PROFILES = (CONSTANT, POISSON, BURST)
+
+
+class TokenBucket(object):
+    """
+        Limits the rate of events to `rate` per second, allowing bursts
+        of up to `capacity` events.
+    """
+
+    def __init__(self, rate, capacity=1, clock=time.time):
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated = clock()
+
+    def delay(self):
+        """
+            Takes a token, returning the seconds to wait until it's available
+        """
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RateScheduler(object):
+    """
+        Paces the sending of messages following a rate profile.
+
+        The schedule is open loop: the time of each slot is fixed from the start
+        of the schedule, and doesn't depend on how long it took to send the
+        previous messages, so a slow server doesn't lower the offered load.
+        Instead of polling the clock, it sleeps until the next slot.
+
+        A single scheduler can be shared by all the clients of a process, and
+        optionally limit the rate of all of them together with `max_rate`.
+    """
+
+    def __init__(self, sleep=time.sleep, clock=time.time, max_rate=None):
+        self.sleep = sleep
+        self.clock = clock
+        self.bucket = TokenBucket(max_rate, clock=clock) if max_rate else None
+
+    @staticmethod
+    def offsets(rate, profile=CONSTANT, burst=1):
+        """
+            Generates the offsets in seconds from the start of the schedule
+            of each slot. A rate of 0 means no limit.
+        """
+        if profile not in PROFILES:
+            raise ValueError('Unknown rate profile {}'.format(profile))
+
+        offset = 0.0
+        index = 0
+        while True:
+            if not rate:
+                yield 0.0
+            elif profile == POISSON:
+                yield offset
+                offset += random.expovariate(rate)
+            elif profile == BURST:
+                # Groups of `burst` slots at once, keeping the average rate
+                yield (index // burst) * burst / float(rate)
+            else:
+                yield index / float(rate)
+            index += 1
+
+    def pace(self, count, rate, profile=CONSTANT, burst=1, start=None):
+        """
+            Generates `count` slots, waiting until the time of each one.
+            Yields the intended time of each slot, so the lag on sending can
+            be accounted for.
+        """
+        start = self.clock() if start is None else start
+        offsets = self.offsets(rate, profile, burst)
+        for index in range(count):
+            intended = start + next(offsets)
+            delay = intended - self.clock()
+            if self.bucket is not None:
+                delay = max(delay, self.bucket.delay())
+            # Always sleep, even if late, to let other greenlets run
+            self.sleep(max(delay, 0))
+            yield intended
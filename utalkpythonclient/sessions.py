@@ -0,0 +1,47 @@
+# Session shared by all the clients and transports not given a specific one
+shared_session = None
+
+
+def create_session(pool_connections=10, pool_maxsize=10, retries=3, backoff_factor=0.1, pool_block=False):
+    """
+        Creates a http session keeping connections alive.
+
+        pool_connections is the number of hosts with pooled connections, and
+        pool_maxsize the number of connections kept for each host. Failed connections
+        and gateway errors are retried `retries` times, waiting backoff_factor
+        seconds, growing exponentially, between retries.
+
+        Connections beyond pool_maxsize are closed after each request, so
+        sessions shared by many xhr clients need a pool_maxsize of at least
+        twice the number of clients, one for polling and one for sending.
+    """
+    # Imported here, as requests is slow to import and not needed until the first request
+    from requests.adapters import HTTPAdapter
+    from requests.packages.urllib3.util.retry import Retry
+    import requests
+
+    session = requests.Session()
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(502, 503, 504))
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=retry,
+        pool_block=pool_block)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session(session=None):
+    """
+        Returns the given session, or the shared one if none given.
+    """
+    global shared_session
+    if session is not None:
+        return session
+    if shared_session is None:
+        shared_session = create_session()
+    return shared_session
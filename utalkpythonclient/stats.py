@@ -0,0 +1,167 @@
+from collections import deque
+from collections import OrderedDict
+
+import math
+import time
+
+# Samples below this value (in seconds) share the first histogram bucket
+RESOLUTION = 0.000001
+
+
+class Metric(object):
+    """
+        Streaming statistics of a series of samples, as latencies in seconds.
+
+        Count, mean, min and max are updated on every sample. Percentiles are
+        calculated from a histogram of logarithmic buckets, each one a `precision`
+        wider than the previous one, so memory usage depends on the range of the
+        values, not on the number of samples. Optionally, the last `recent` samples
+        are also kept.
+    """
+
+    def __init__(self, name, precision=0.01, recent=0):
+        self.name = name
+        self.precision = precision
+        self.log_base = math.log(1 + precision)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = {}
+        self.recent = deque(maxlen=recent) if recent else None
+
+        # Wall time of the first and last samples
+        self.first = None
+        self.last = None
+
+    def bucket(self, value):
+        """
+            Index of the histogram bucket of a value
+        """
+        if value <= RESOLUTION:
+            return 0
+        return int(math.log(value / RESOLUTION) / self.log_base) + 1
+
+    def bucket_value(self, bucket):
+        """
+            Highest value that falls on a bucket
+        """
+        return RESOLUTION * (1 + self.precision) ** bucket
+
+    def add(self, value):
+        """
+            Accounts a new sample
+        """
+        now = time.time()
+        if self.first is None:
+            self.first = now
+        self.last = now
+
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+        bucket = self.bucket(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+        if self.recent is not None:
+            self.recent.append(value)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def elapsed(self):
+        """
+            Seconds between the first and the last sample
+        """
+        return self.last - self.first if self.count else 0.0
+
+    def percentile(self, percent):
+        """
+            Value below which the given percent of samples fall.
+        """
+        if not self.count:
+            return 0.0
+
+        rank = self.count * percent / 100.0
+        accumulated = 0
+        for bucket in sorted(self.buckets):
+            accumulated += self.buckets[bucket]
+            if accumulated >= rank:
+                return min(max(self.bucket_value(bucket), self.min), self.max)
+        return self.max
+
+    def merge(self, other):
+        """
+            Accounts the samples of another metric of the same precision
+        """
+        if not other.count:
+            return
+        self.count += other.count
+        self.total += other.total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.first = other.first if self.first is None else min(self.first, other.first)
+        self.last = other.last if self.last is None else max(self.last, other.last)
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        if self.recent is not None and other.recent is not None:
+            self.recent.extend(other.recent)
+
+    def summary(self):
+        """
+            Returns a one-line human readable summary of the metric
+        """
+        return '{}: {} samples, mean {:.3f}s, min {:.3f}s, max {:.3f}s, p50 {:.3f}s, p95 {:.3f}s, p99 {:.3f}s'.format(
+            self.name, self.count, self.mean, self.min or 0.0, self.max or 0.0,
+            self.percentile(50), self.percentile(95), self.percentile(99))
+
+
+class Stats(object):
+    """
+        Collection of named metrics.
+    """
+
+    def __init__(self, *names, **options):
+        self.options = options
+        self.metrics = OrderedDict()
+        for name in names:
+            self.add_metric(name)
+
+    def __getitem__(self, name):
+        return self.metrics[name]
+
+    def __contains__(self, name):
+        return name in self.metrics
+
+    def add_metric(self, name):
+        """
+            Creates a new metric, if not already there
+        """
+        if name not in self.metrics:
+            self.metrics[name] = Metric(name, **self.options)
+        return self.metrics[name]
+
+    def add(self, name, value):
+        """
+            Accounts a new sample on a metric
+        """
+        self.metrics[name].add(value)
+
+    def merge(self, other):
+        """
+            Accounts all the samples of the metrics of another stats object
+        """
+        for name, metric in other.metrics.items():
+            self.add_metric(name).merge(metric)
+
+    def summary(self):
+        """
+            Returns a human readable summary of all the metrics
+        """
+        return '\n'.join([metric.summary() for metric in self.metrics.values()])
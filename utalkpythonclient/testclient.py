@@ -1,31 +1,49 @@
 from utalkpythonclient.client import UTalkClient
+from utalkpythonclient.scheduler import RateScheduler
+from utalkpythonclient.utils import parse_timestamp
 from gevent.monkey import patch_all
+from itertools import izip
 import gevent
-from datetime import datetime, timedelta
+import time
+
+# Scheduler shared by all the test clients of the process
+scheduler = RateScheduler(sleep=gevent.sleep)
 
 
 class UTalkTestClient(UTalkClient):
 
-    def setup(self, conversation, send, expect, ready, start_delay=0, message_delay=0):
+    def setup(self, conversation, send, expect, ready, start_delay=0, message_delay=0, profile='constant', burst=1, scheduler=scheduler):
         """
-            Configures the test
+            Configures the test.
+
+            Messages are sent following the rate profile, constant, poisson or
+            burst, at an average of one message each message_delay seconds.
         """
         self.to_send = send
         self.wait_send = ready
         self.conversation = conversation
         self.start_delay = start_delay
         self.message_delay = message_delay
+        self.profile = profile
+        self.burst = burst
+        self.scheduler = scheduler
 
         self.expected_messages = send + expect
         self.expected_acks = send + expect
 
         self.received_messages = 0
         self.ackd_messages = 0
-        self.stats = {
-            "recv_times": [],
-            "ackd_times": [],
-            "send_times": []
-        }
+
+        # Set once listening, clients ending without it failed to connect
+        self.listening = False
+
+        # Latencies of messages from other users, and of our own messages
+        self.stats.add_metric('recv_times')
+        self.stats.add_metric('ackd_times')
+        self.stats.add_metric('send_times')
+
+        # Delay of each message sent from its scheduled time
+        self.stats.add_metric('send_lag')
 
     def succeded(self):
         return self.received_messages >= self.expected_messages and \
@@ -36,12 +54,11 @@ class UTalkTestClient(UTalkClient):
 
     def on_message_received(self, message):
         # Collect stats for messages received from other users
+        elapsed = time.time() - parse_timestamp(message.json['p'])
         if self.username != message.json['u']['u']:
-            now = datetime.utcnow()
-            sent = datetime.strptime(message.json['p'], '%Y-%m-%dT%H:%M:%S.%fZ')
-            self.stats['recv_times'].append((sent, now))
+            self.stats.add('recv_times', elapsed)
         else:
-            self.stats['send_times'].append(datetime.strptime(message.json['p'], '%Y-%m-%dT%H:%M:%S.%fZ'))
+            self.stats.add('send_times', elapsed)
 
         self.received_messages += 1
         self.test_finished()
@@ -51,9 +68,7 @@ class UTalkTestClient(UTalkClient):
 
     def on_message_ackd(self, message):
         if self.username != message.json['u']['u']:
-            now = datetime.utcnow()
-            sent = datetime.strptime(message.json['p'], '%Y-%m-%dT%H:%M:%S.%fZ')
-            self.stats['ackd_times'].append((sent, now))
+            self.stats.add('ackd_times', time.time() - parse_timestamp(message.json['p']))
 
         self.ackd_messages += 1
         self.test_finished()
@@ -72,18 +87,18 @@ class UTalkTestClient(UTalkClient):
             yield (self.conversation, 'This is Message {} from {}'.format(i, self.username))
 
     def on_start_listening(self):
+        self.listening = True
         self.wait_send.ready()
         gevent.sleep()
         self.wait_send.event.get()
         gevent.sleep(self.start_delay * 1.6)
 
         self.log("start sending {} messages".format(self.username))
-        next_message_date = datetime.utcnow()
-        for conversation_id, text in self.messages:
-            while datetime.utcnow() <= next_message_date:
-                gevent.sleep()
+        rate = 1.0 / self.message_delay if self.message_delay else 0
+        slots = self.scheduler.pace(self.to_send, rate, self.profile, self.burst)
+        for (conversation_id, text), intended in izip(self.messages, slots):
+            self.stats.add('send_lag', time.time() - intended)
             self.send_message(conversation_id, text)
-            next_message_date = datetime.utcnow() + timedelta(seconds=self.message_delay)
 
     def teardown(self):
         """
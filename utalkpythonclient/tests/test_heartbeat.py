@@ -0,0 +1,130 @@
+from utalkpythonclient.heartbeat import Heartbeat
+from utalkpythonclient.heartbeat import Timer
+from utalkpythonclient.heartbeat import TimerWheel
+from utalkpythonclient.heartbeat import negotiate
+from utalkpythonclient.heartbeat import parse_heart_beat
+
+import unittest
+
+
+class TimerWheelTests(unittest.TestCase):
+
+    def setUp(self):
+        # Never started, ticks are advanced by hand
+        self.wheel = TimerWheel(tick=0.1, size=8)
+        self.fired = []
+
+    def add(self, interval, name, repeat=False):
+        timer = Timer(interval, lambda: self.fired.append((self.ticks, name)), repeat)
+        self.wheel.add(timer)
+        return timer
+
+    def advance(self, ticks):
+        for tick in range(ticks):
+            self.ticks += 1
+            self.wheel.advance()
+
+    def run_ticks(self, ticks):
+        self.ticks = 0
+        self.advance(ticks)
+        return self.fired
+
+    def test_fires_on_expiration_slot(self):
+        self.add(0.3, 'a')
+        self.add(0.5, 'b')
+        self.assertEqual(self.run_ticks(8), [(3, 'a'), (5, 'b')])
+
+    def test_intervals_below_a_tick_fire_on_next_tick(self):
+        self.add(0.01, 'a')
+        self.assertEqual(self.run_ticks(2), [(1, 'a')])
+
+    def test_timers_beyond_a_turn_wait_rounds(self):
+        # 8 ticks is a full turn, 8, 11 and 19 ticks wait 0, 1 and 2 rounds
+        self.assertEqual(self.add(0.8, 'a').rounds, 0)
+        self.assertEqual(self.add(1.1, 'b').rounds, 1)
+        self.assertEqual(self.add(1.9, 'c').rounds, 2)
+        self.assertEqual(self.run_ticks(24), [(8, 'a'), (11, 'b'), (19, 'c')])
+
+    def test_position_is_kept_when_adding(self):
+        self.run_ticks(5)
+        self.add(0.6, 'a')
+        self.advance(8)
+        self.assertEqual(self.fired, [(11, 'a')])
+
+    def test_repeating_timer(self):
+        self.add(0.3, 'a', repeat=True)
+        self.assertEqual(self.run_ticks(10), [(3, 'a'), (6, 'a'), (9, 'a')])
+
+    def test_cancelled_timer_not_fired(self):
+        self.add(0.2, 'a', repeat=True).cancel()
+        self.add(0.3, 'b')
+        self.assertEqual(self.run_ticks(8), [(3, 'b')])
+
+    def test_failing_timer_does_not_stop_others(self):
+        self.wheel.add(Timer(0.2, lambda: 1 / 0))
+        self.add(0.2, 'a')
+        self.assertEqual(self.run_ticks(3), [(2, 'a')])
+
+
+class NegotiationTests(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_heart_beat('10000,5000'), (10000, 5000))
+        self.assertEqual(parse_heart_beat(''), (0, 0))
+        self.assertEqual(parse_heart_beat(None), (0, 0))
+
+    def test_takes_the_slowest_of_both_sides(self):
+        self.assertEqual(negotiate((10000, 10000), (5000, 20000)), (20000, 10000))
+
+    def test_disabled_if_either_side_cant(self):
+        self.assertEqual(negotiate((0, 10000), (5000, 20000)), (0, 10000))
+        self.assertEqual(negotiate((10000, 10000), (0, 20000)), (20000, 0))
+        self.assertEqual(negotiate((10000, 10000), (0, 0)), (0, 0))
+
+
+class FakeWheel(object):
+
+    def __init__(self):
+        self.timers = []
+
+    def schedule(self, interval, callback, repeat=False):
+        timer = Timer(interval, callback, repeat)
+        self.timers.append(timer)
+        return timer
+
+
+class HeartbeatTests(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        self.beats = []
+        self.deaths = []
+        self.wheel = FakeWheel()
+        self.heartbeat = Heartbeat(
+            lambda: self.beats.append(self.now), lambda: self.deaths.append(self.now),
+            outgoing=10000, incoming=5000, wheel=self.wheel, clock=lambda: self.now).start()
+
+    def test_timers(self):
+        self.assertEqual([(timer.interval, timer.repeat) for timer in self.wheel.timers], [(5.0, True), (5.0, True)])
+
+    def test_beats_only_when_idle(self):
+        self.now += 5
+        self.heartbeat.check_outgoing()
+        self.now += 1
+        self.heartbeat.sent()
+        self.now += 4
+        self.heartbeat.check_outgoing()
+        self.assertEqual(self.beats, [105.0])
+
+    def test_dead_after_tolerance(self):
+        self.now += 10
+        self.heartbeat.check_incoming()
+        self.heartbeat.received()
+        self.now += 10.5
+        self.heartbeat.check_incoming()
+        self.assertEqual(self.deaths, [120.5])
+        self.assertTrue(all(timer.cancelled for timer in self.wheel.timers))
+
+
+if __name__ == '__main__':
+    unittest.main()
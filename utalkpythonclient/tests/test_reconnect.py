@@ -0,0 +1,75 @@
+from utalkpythonclient.reconnect import CLOSED
+from utalkpythonclient.reconnect import HALF_OPEN
+from utalkpythonclient.reconnect import OPEN
+from utalkpythonclient.reconnect import ReconnectPolicy
+
+import unittest
+
+
+class ReconnectPolicyTests(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+
+    def policy(self, **options):
+        options.setdefault('jitter', False)
+        return ReconnectPolicy(clock=lambda: self.now, **options)
+
+    def fail(self, policy, times):
+        delays = []
+        for attempt in range(times):
+            policy.failed()
+            delays.append(policy.next_delay())
+        return delays
+
+    def test_exponential_backoff_up_to_maximum(self):
+        policy = self.policy(initial=0.5, maximum=3.0, threshold=None)
+        self.assertEqual(self.fail(policy, 5), [0.5, 1.0, 2.0, 3.0, 3.0])
+
+    def test_jitter_keeps_half_the_delay(self):
+        policy = self.policy(initial=1.0, maximum=8.0, jitter=True, threshold=None)
+        for delay, base in zip(self.fail(policy, 6), [1.0, 2.0, 4.0, 8.0, 8.0, 8.0]):
+            self.assertTrue(base / 2 <= delay <= base)
+
+    def test_gives_up_after_max_attempts(self):
+        policy = self.policy(max_attempts=2, threshold=None)
+        self.assertEqual(self.fail(policy, 3), [0.5, 1.0, None])
+
+    def test_success_resets_backoff(self):
+        policy = self.policy(threshold=None)
+        self.fail(policy, 3)
+        policy.succeeded()
+        self.assertEqual(self.fail(policy, 1), [0.5])
+
+    def test_opens_after_threshold(self):
+        policy = self.policy(threshold=3, cooldown=60.0)
+        self.fail(policy, 2)
+        self.assertEqual(policy.state, CLOSED)
+        policy.failed()
+        self.assertEqual(policy.state, OPEN)
+
+        # Waits the cooldown from when it opened, and lets a single attempt through
+        self.now += 10
+        self.assertEqual(policy.next_delay(), 50.0)
+        self.assertEqual(policy.state, HALF_OPEN)
+
+    def test_half_open_failure_opens_again(self):
+        policy = self.policy(threshold=3, cooldown=60.0)
+        self.fail(policy, 3)
+        self.now += 60
+        policy.failed()
+        self.assertEqual(policy.state, OPEN)
+        self.assertEqual(policy.opened, self.now)
+        self.assertEqual(policy.next_delay(), 60.0)
+
+    def test_half_open_success_closes(self):
+        policy = self.policy(threshold=3, cooldown=60.0)
+        self.fail(policy, 3)
+        policy.succeeded()
+        self.assertEqual(policy.state, CLOSED)
+        self.assertEqual(policy.failures, 0)
+        self.assertEqual(self.fail(policy, 1), [0.5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+from utalkpythonclient._sockjs import SockJSParser
+from utalkpythonclient._sockjs import SOCKJS_CLOSE
+from utalkpythonclient._sockjs import SOCKJS_HEARTBEAT
+from utalkpythonclient._sockjs import SOCKJS_MESSAGE
+from utalkpythonclient._sockjs import SOCKJS_OPEN
+from utalkpythonclient.transports import ChunkedDecoder
+
+import json
+import unittest
+
+# Messages with quotes, brackets and backslashes, as json encoded on the stream
+STREAM = (
+    'o\n'
+    'h\n'
+    'a["MESSAGE\\ndestination:/a\\n\\n{\\"text\\":\\"[\\\\\\"]\\"}\\u0000","two \\"]\\" \\\\"]\n'
+    'm"single \\\\\\""\n'
+    'h\n'
+    'c[3000,"Go away!"]\n'
+)
+
+EXPECTED = [
+    (SOCKJS_OPEN, ''),
+    (SOCKJS_HEARTBEAT, ''),
+    (SOCKJS_MESSAGE, u'MESSAGE\ndestination:/a\n\n{"text":"[\\"]"}\x00'),
+    (SOCKJS_MESSAGE, u'two "]" \\'),
+    (SOCKJS_MESSAGE, u'single \\"'),
+    (SOCKJS_HEARTBEAT, ''),
+    (SOCKJS_CLOSE, '3000 "Go away!"'),
+]
+
+
+def feed(chunks):
+    parser = SockJSParser()
+    frames = []
+    for chunk in chunks:
+        frames.extend(parser.feed(chunk))
+    return [tuple(frame) for frame in frames]
+
+
+class SockJSParserTests(unittest.TestCase):
+
+    def test_whole_stream(self):
+        self.assertEqual(feed([STREAM]), EXPECTED)
+
+    def test_split_at_every_position(self):
+        for position in range(len(STREAM) + 1):
+            self.assertEqual(
+                feed([STREAM[:position], STREAM[position:]]), EXPECTED,
+                'Stream split at {}: {!r}'.format(position, STREAM[position - 5:position]))
+
+    def test_fed_byte_by_byte(self):
+        self.assertEqual(feed(STREAM), EXPECTED)
+
+    def test_chunk_ending_on_escaping_backslash(self):
+        # The quote starting the second chunk is escaped, so the string continues
+        self.assertEqual(feed(['a["a\\', '"]", "b"]\n']), [(SOCKJS_MESSAGE, u'a"]'), (SOCKJS_MESSAGE, u'b')])
+
+    def test_chunk_ending_on_escaped_backslash(self):
+        # The backslash is escaped, so the quote starting the second chunk ends the string
+        self.assertEqual(feed(['a["a\\\\', '"]\n']), [(SOCKJS_MESSAGE, u'a\\')])
+
+    def test_large_array(self):
+        messages = ['message {} "]"'.format(index) for index in range(1000)]
+        stream = 'a[{}]\n'.format(', '.join(json.dumps(message) for message in messages))
+        self.assertEqual(feed([stream]), [(SOCKJS_MESSAGE, message) for message in messages])
+
+    def test_close_frame(self):
+        self.assertEqual(feed(['c[2010,"Another connection still open"]\n']),
+                         [(SOCKJS_CLOSE, '2010 "Another connection still open"')])
+
+    def test_chunk_sizes_between_frames_are_skipped(self):
+        # Raw chunked xhr_streaming responses
+        self.assertEqual(feed(['2\r\no\n\r\n', 'a\r\na["m"]\n\r\n', '2\r\nh\n\r\n']),
+                         [(SOCKJS_OPEN, ''), (SOCKJS_MESSAGE, u'm'), (SOCKJS_HEARTBEAT, '')])
+
+    def test_resync_on_false_opcode(self):
+        # "a" not followed by an array is noise
+        self.assertEqual(feed(['data\na["m"]\n']), [(SOCKJS_MESSAGE, u'm')])
+
+
+class ChunkedDecoderTests(unittest.TestCase):
+
+    def decode(self, chunks):
+        decoder = ChunkedDecoder()
+        parser = SockJSParser()
+        frames = []
+        for chunk in chunks:
+            frames.extend(parser.feed(decoder.feed(chunk)))
+        return frames, decoder.done
+
+    def test_frame_split_across_chunks(self):
+        # Chunk size lines inside a frame must not end up in the message
+        frames, done = self.decode(['2\r\no\n\r\n5\r\na["ab\r\n', '5\r\ncd"]\n\r\n0\r\n\r\n'])
+        self.assertEqual(frames, [(SOCKJS_OPEN, ''), (SOCKJS_MESSAGE, u'abcd')])
+        self.assertTrue(done)
+
+    def test_size_lines_split_across_reads(self):
+        stream = '2\r\no\n\r\n0A;name=value\r\na["abcd"]\n\r\n0\r\n\r\n'
+        frames, done = self.decode([character for character in stream])
+        self.assertEqual(frames, [(SOCKJS_OPEN, ''), (SOCKJS_MESSAGE, u'abcd')])
+        self.assertTrue(done)
+
+
+if __name__ == '__main__':
+    unittest.main()
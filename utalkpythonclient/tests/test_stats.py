@@ -0,0 +1,82 @@
+from utalkpythonclient.stats import Metric
+from utalkpythonclient.stats import Stats
+
+import unittest
+
+
+class MetricTests(unittest.TestCase):
+
+    def metric(self, values, **options):
+        metric = Metric('latency', **options)
+        for value in values:
+            metric.add(value)
+        return metric
+
+    def test_counters(self):
+        metric = self.metric([0.3, 0.1, 0.2])
+        self.assertEqual(metric.count, 3)
+        self.assertAlmostEqual(metric.mean, 0.2)
+        self.assertEqual((metric.min, metric.max), (0.1, 0.3))
+
+    def test_empty(self):
+        metric = self.metric([])
+        self.assertEqual((metric.mean, metric.percentile(50), metric.elapsed), (0.0, 0.0, 0.0))
+
+    def test_percentiles_within_precision(self):
+        values = [index / 1000.0 for index in range(1, 1001)]
+        metric = self.metric(values, precision=0.01)
+        for percent in (50, 90, 95, 99):
+            expected = values[int(len(values) * percent / 100.0) - 1]
+            self.assertTrue(abs(metric.percentile(percent) - expected) <= expected * 0.01)
+
+    def test_percentiles_bounded_by_samples(self):
+        metric = self.metric([0.5] * 10)
+        self.assertEqual(metric.percentile(0), 0.5)
+        self.assertEqual(metric.percentile(100), 0.5)
+
+    def test_memory_bounded_by_range(self):
+        metric = self.metric([0.1, 0.2] * 5000)
+        self.assertEqual(len(metric.buckets), 2)
+
+    def test_recent_samples(self):
+        metric = self.metric([1, 2, 3, 4], recent=2)
+        self.assertEqual(list(metric.recent), [3, 4])
+
+    def test_merge(self):
+        first = self.metric([0.1, 0.2])
+        second = self.metric([0.3, 0.4, 0.5])
+        first.merge(second)
+        whole = self.metric([0.1, 0.2, 0.3, 0.4, 0.5])
+        self.assertEqual((first.count, first.min, first.max), (5, 0.1, 0.5))
+        self.assertAlmostEqual(first.mean, 0.3)
+        self.assertEqual(first.buckets, whole.buckets)
+        self.assertEqual(first.percentile(50), whole.percentile(50))
+        self.assertEqual((first.first, first.last), (min(first.first, second.first), second.last))
+
+    def test_merge_empty(self):
+        metric = self.metric([])
+        metric.merge(self.metric([0.2]))
+        metric.merge(self.metric([]))
+        self.assertEqual((metric.count, metric.min, metric.max), (1, 0.2, 0.2))
+
+
+class StatsTests(unittest.TestCase):
+
+    def test_merge_adds_missing_metrics(self):
+        stats = Stats('sent')
+        stats.add('sent', 0.1)
+        other = Stats('sent', 'received')
+        other.add('sent', 0.3)
+        other.add('received', 0.2)
+        stats.merge(other)
+        self.assertEqual(stats.metrics.keys(), ['sent', 'received'])
+        self.assertEqual(stats['sent'].count, 2)
+        self.assertEqual(stats['received'].count, 1)
+
+    def test_metric_options(self):
+        stats = Stats('sent', recent=1)
+        self.assertEqual(stats['sent'].recent.maxlen, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from utalkpythonclient._stomp import StompAccessDenied
+from utalkpythonclient._stomp import StompError
+from utalkpythonclient._stomp import StompExchangeNotFound
+from utalkpythonclient._stomp import StompHelper
+
+import unittest
+
+
+class StompDecodeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.stomp = StompHelper()
+
+    def test_message(self):
+        message = self.stomp.decode(u'MESSAGE\ndestination:/exchange/a.messages\n\n{"a": [1, 2]}\x00')
+        self.assertEqual(message.command, 'MESSAGE')
+        self.assertEqual(message.destination, '/exchange/a.messages')
+        self.assertEqual(message.body, u'{"a": [1, 2]}')
+        self.assertEqual(message.json, {'a': [1, 2]})
+
+    def test_leading_heart_beats_skipped(self):
+        message = self.stomp.decode(u'\n\r\nMESSAGE\n\n{}\x00')
+        self.assertEqual(message.command, 'MESSAGE')
+        self.assertEqual(message.json, {})
+
+    def test_header_unescaping(self):
+        message = self.stomp.decode(u'MESSAGE\nkey\\cname:a\\nb\\cc\\\\d\\re\n\n\x00')
+        self.assertEqual(message.headers, {'key:name': 'a\nb:c\\d\re'})
+
+    def test_connected_headers_not_unescaped(self):
+        message = self.stomp.decode(u'CONNECTED\nserver:a\\cb\n\n\x00')
+        self.assertEqual(message.headers['server'], 'a\\cb')
+
+    def test_repeated_header_keeps_first(self):
+        message = self.stomp.decode(u'MESSAGE\nname:first\nname:second\n\n\x00')
+        self.assertEqual(message.headers['name'], 'first')
+
+    def test_content_length(self):
+        # Body containing a NUL, delimited by its content-length
+        message = self.stomp.decode(u'MESSAGE\ncontent-length:4\n\na\x00bc\x00')
+        self.assertEqual(message.body, u'a\x00bc')
+
+    def test_content_length_not_on_frame_end(self):
+        # Octets counted before decoding, falls back to the NUL terminator
+        message = self.stomp.decode(u'MESSAGE\ncontent-length:10\n\n"\xe9\xe9"\x00')
+        self.assertEqual(message.json, u'\xe9\xe9')
+
+    def test_empty_body(self):
+        message = self.stomp.decode(u'MESSAGE\n\n\x00')
+        self.assertEqual(message.body, u'')
+        self.assertEqual(message.json, u'')
+
+    def test_json_with_surrounding_whitespace(self):
+        message = self.stomp.decode(u'MESSAGE\n\n {"a": 1}\n\x00')
+        self.assertEqual(message.json, {'a': 1})
+
+    def test_body_not_json(self):
+        message = self.stomp.decode(u'MESSAGE\n\nnot json\x00')
+        self.assertRaises(StompError, lambda: message.json)
+
+    def test_body_with_extra_data(self):
+        message = self.stomp.decode(u'MESSAGE\n\n{"a": 1} x\x00')
+        self.assertRaises(StompError, lambda: message.json)
+
+    def test_error_not_json(self):
+        self.assertRaises(StompError, self.stomp.decode, u'ERROR\nmessage:failed\n\nSomething went wrong\x00')
+
+    def test_error_access_refused(self):
+        self.assertRaises(StompAccessDenied, self.stomp.decode, u'ERROR\n\nAccess refused for user\x00')
+
+    def test_error_exchange_not_found(self):
+        self.assertRaises(StompExchangeNotFound, self.stomp.decode, u"ERROR\n\nNOT_FOUND - no exchange 'a'\x00")
+
+    def test_error_json(self):
+        message = self.stomp.decode(u'ERROR\n\n{"error": "failed"}\x00')
+        self.assertEqual(message.json, {'error': 'failed'})
+
+    def test_incomplete_frame(self):
+        self.assertRaises(Exception, self.stomp.decode, u'MESSAGE\ndestination:/a')
+
+
+if __name__ == '__main__':
+    unittest.main()
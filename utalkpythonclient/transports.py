@@ -1,25 +1,21 @@
 from collections import namedtuple
-from ws4py.client.threadedclient import WebSocketClient as ThreadedWebSocketClient
-from ws4py.client.geventclient import WebSocketClient as GeventWebSocketClient
+from importlib import import_module
+from utalkpythonclient._sockjs import SockJSParser
+from utalkpythonclient._sockjs import SOCKJS_CLOSE
+from utalkpythonclient._sockjs import SOCKJS_HEARTBEAT
+from utalkpythonclient._sockjs import SOCKJS_MESSAGE
+from utalkpythonclient._sockjs import SOCKJS_OPEN
+from utalkpythonclient import jsoncodec
+from utalkpythonclient.sessions import get_session
+from utalkpythonclient.utils import lazy_attributes
 
 import httplib
-import json
 import random
 import re
-import requests
 import socket
 import string
-import wsaccel
-
-wsaccel.patch_ws4py()
-
-SOCKJS_OPEN = 'o'
-SOCKJS_MESSAGE = 'm'
-SOCKJS_ARRAY = 'a'
-SOCKJS_HEARTBEAT = 'h'
-SOCKJS_CLOSE = 'c'
-
-SockJSFrame = namedtuple('SockJSFrame', ['type', 'content'])
+import threading
+import time
 
 
 class SockJSTransport(object):
@@ -36,7 +32,13 @@ class SockJSTransport(object):
 
     frame = namedtuple('SockJSFrame', ['data'])
 
-    def __init__(self, url, prefix, use_gevent=False):
+    # Batching of outgoing messages, disabled by default
+    batching = False
+    batch_window = 0.01
+    batch_size = 100
+    batch_bytes = 65536
+
+    def __init__(self, url, prefix, use_gevent=False, session=None):
         """
             Parses url to found all the necessary bits for the connection.
 
@@ -45,7 +47,13 @@ class SockJSTransport(object):
 
             The idea is that any transport subclass has all the nedded bits to use
             them as they need.
+
+            Http requests are made using the provided requests session,
+            or the shared one if none provided.
         """
+        self.session = get_session(session)
+        self.use_gevent = use_gevent
+
         schema, host, port, path = re.match(r'(\w+)?(?:://)?([^:/]+)(?::(\d+))?/?(.*?)/?$', url).groups()
 
         # If schema not defined, determine by its port
@@ -85,6 +93,15 @@ class SockJSTransport(object):
         self.path = '/'.join([self.base_path, self.greeting_path])
 
         self.closing = False
+        self.parser = SockJSParser()
+
+        self.batch = []
+        self.batch_length = 0
+        self.batch_timer = None
+        self.batch_lock = self.create_lock()
+
+        # Held while taking and sending a batch, so batches are sent in order
+        self.send_lock = self.create_lock()
 
     @property
     def base_url(self):
@@ -122,44 +139,6 @@ class SockJSTransport(object):
         letters = string.ascii_lowercase + string.digits
         return ''.join(random.choice(letters) for c in range(length))
 
-    @staticmethod
-    def parse_sockjs(frame):
-        """
-            Parses a sockjs frame and extracts it's content.
-            Transforms arrays of messages into single message frames.
-        """
-        try:
-            opcode, body = re.search(r'([acmoh])(.*)', frame, re.DOTALL | re.MULTILINE).groups()
-        except:
-            return [], frame
-
-        # Try to parse body-less frames first, if found, return remaining data
-        if opcode in 'oh':
-            return [SockJSFrame(opcode, "")], body
-
-        # Try to parse frames with array of messages, transformt opcode to 'm'
-        # for each message in array
-        elif opcode in "a":
-            full_frames = []
-            match = re.search(r'(\[".*?"\])(.*)$', frame, re.DOTALL | re.MULTILINE)
-            # we have a full frame
-            if match:
-                full, remaining = match.groups()
-                sockjs_array = json.loads(full)
-                for item in sockjs_array:
-                    full_frames.append(SockJSFrame('m', item))
-
-                return full_frames, remaining
-            # we failed in parsing a full frame, so assume it's partial, and continue
-            else:
-                return [], frame
-        elif opcode == 'c':
-            return [SockJSFrame(opcode, '{} "{}"'.format(*json.loads(body)))], ''
-        elif opcode == 'm':
-            raise Exception('Message frame received, {}'.format(body))
-
-        return [], ''
-
     def noop(self, *args):
         """
             NOOP :)
@@ -187,19 +166,123 @@ class SockJSTransport(object):
         elif frame.type is SOCKJS_MESSAGE:
             self.on_message(frame)
         elif frame.type is SOCKJS_CLOSE:
+            # Server closed the session, stop listening
+            self.closing = True
             self.on_close(frame.content)
 
     def sockjs_info(self):
         """
             Retrieves sockjs endpoint information
         """
-        response = requests.get(self.base_url + '/info')
+        response = self.session.get(self.base_url + '/info')
         return response.content
 
+    def configure_batching(self, window=None, size=None, max_bytes=None):
+        """
+            Enables batching of outgoing messages. Messages sent are queued, and
+            sent together on a single sockjs array when `size` messages or `max_bytes`
+            are queued, or `window` seconds after the first one was queued.
+        """
+        self.batching = True
+        if window is not None:
+            self.batch_window = window
+        if size is not None:
+            self.batch_size = size
+        if max_bytes is not None:
+            self.batch_bytes = max_bytes
+
+    @staticmethod
+    def encode(message):
+        """
+            Encodes a message as a json string, to be sent on a sockjs array
+        """
+        return jsoncodec.codec.dumps(message)
+
     def send(self, message):
-        wrapped = '["{}"]'.format(message)
-        self._send(wrapped)
-        return wrapped
+        """
+            Sends a message, or queues it for the next batch if batching enabled.
+        """
+        return self.send_encoded(self.encode(message))
+
+    def send_encoded(self, encoded):
+        """
+            Sends a message already encoded as a json string.
+        """
+        if not self.batching:
+            wrapped = '[{}]'.format(encoded)
+            self._send(wrapped)
+            return wrapped
+
+        with self.batch_lock:
+            self.batch.append(encoded)
+            self.batch_length += len(encoded)
+            full = len(self.batch) >= self.batch_size or self.batch_length >= self.batch_bytes
+            if not full and self.batch_timer is None:
+                self.batch_timer = self.start_batch_timer()
+
+        if full:
+            return self.flush()
+
+    def flush(self):
+        """
+            Sends all the queued messages on a single sockjs array
+        """
+        with self.send_lock:
+            with self.batch_lock:
+                batch = self.batch
+                self.batch = []
+                self.batch_length = 0
+                if self.batch_timer is not None:
+                    self.cancel_batch_timer(self.batch_timer)
+                    self.batch_timer = None
+
+            if batch:
+                wrapped = '[{}]'.format(','.join(batch))
+                self._send(wrapped)
+                return wrapped
+
+    def flush_batch_window(self):
+        """
+            Flushes the queued messages when the batch window expires
+        """
+        with self.batch_lock:
+            self.batch_timer = None
+        self.flush()
+
+    def sleep(self, seconds):
+        """
+            Waits without blocking other greenlets when on gevent mode
+        """
+        if self.use_gevent:
+            import gevent
+            gevent.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    def create_lock(self):
+        """
+            Returns a lock that yields to other greenlets when on gevent mode,
+            as sockets may be patched while threading is not.
+        """
+        if self.use_gevent:
+            from gevent.lock import Semaphore
+            return Semaphore()
+        return threading.Lock()
+
+    def start_batch_timer(self):
+        if self.use_gevent:
+            import gevent
+            return gevent.spawn_later(self.batch_window, self.flush_batch_window)
+        timer = threading.Timer(self.batch_window, self.flush_batch_window)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def cancel_batch_timer(self, timer):
+        if self.use_gevent:
+            timer.kill(block=False)
+        else:
+            timer.cancel()
 
     def connect(self):
         """
@@ -215,10 +298,19 @@ class SockJSTransport(object):
 
     def close(self):
         """
-            Closes transport connection
+            Closes transport connection, sending queued messages first
         """
+        self.flush()
         self._close()
 
+    def abort(self):
+        """
+            Drops a dead connection, without waiting for the server, so
+            the listening loop ends.
+        """
+        self.closing = True
+        self._abort()
+
     # Methods to be overriden by transport
     # With specific implementations
     def _connect(self):
@@ -230,6 +322,63 @@ class SockJSTransport(object):
     def _close(self):
         pass
 
+    def _abort(self):
+        self._close()
+
+
+class ChunkedDecoder(object):
+    """
+        Incremental decoder of a http body with chunked transfer encoding.
+
+        Data is fed as received from the socket, and the body data found on it
+        is returned, wherever the chunk boundaries fall, as proxies may chunk
+        the stream again in any way.
+    """
+
+    def __init__(self):
+        # Bytes left of the current chunk data, and of the CRLF ending it
+        self.remaining = 0
+        self.terminator = 0
+        # Partial chunk size line
+        self.line = ''
+        self.done = False
+
+    def feed(self, data):
+        """
+            Decodes a new piece of data, returning the body data found.
+        """
+        parts = []
+        position = 0
+        length = len(data)
+        while position < length and not self.done:
+            if self.remaining:
+                end = min(position + self.remaining, length)
+                parts.append(data[position:end])
+                self.remaining -= end - position
+                position = end
+                if not self.remaining:
+                    self.terminator = 2
+            elif self.terminator:
+                skipped = min(self.terminator, length - position)
+                self.terminator -= skipped
+                position += skipped
+            else:
+                end = data.find('\n', position)
+                if end == -1:
+                    self.line += data[position:]
+                    position = length
+                    continue
+                line = self.line + data[position:end]
+                self.line = ''
+                position = end + 1
+                # Chunk size in hex, ignoring chunk extensions
+                size = int(line.split(';')[0].strip(), 16)
+                if size:
+                    self.remaining = size
+                else:
+                    self.done = True
+        return ''.join(parts)
+
 
 class XHRStreamingTransport(SockJSTransport):
     """
@@ -247,6 +396,18 @@ class XHRStreamingTransport(SockJSTransport):
     regular_schema = 'http'
     secure_schema = 'https'
 
+    # Max bytes read from the streaming socket on each recv call
+    buffer_size = 65536
+
+    def __init__(self, url, prefix, use_gevent=False, session=None, buffer_size=None):
+        """
+            Custom init method to allow tuning the size of the reads
+            made on the streaming socket.
+        """
+        if buffer_size is not None:
+            self.buffer_size = buffer_size
+        super(XHRStreamingTransport, self).__init__(url, prefix, use_gevent=use_gevent, session=session)
+
     @property
     def url(self):
         """
@@ -260,7 +421,7 @@ class XHRStreamingTransport(SockJSTransport):
         """
             Make a Http request to send the message to the server
         """
-        response = requests.post(
+        response = self.session.post(
             self.send_url,
             message,
             headers={'Content-Type': 'text/plain'})
@@ -275,27 +436,47 @@ class XHRStreamingTransport(SockJSTransport):
         response = conn.getresponse()
         self.sock = socket.fromfd(response.fileno(), socket.AF_INET, socket.SOCK_STREAM)
 
+        # The raw socket is read, so the transfer encoding must be decoded here
+        chunked = (response.getheader('transfer-encoding') or '').lower() == 'chunked'
+        self.dechunker = ChunkedDecoder() if chunked else None
+
     def _start(self):
         """
             Loops until closing "event" is found.
+
+            Data is read from the socket in chunks of up to buffer_size bytes,
+            decoded from the chunked transfer encoding if used, and fed to the
+            sockjs parser, that keeps partial frames until complete.
         """
-        data = ""
-        partial = ''
         while not self.closing:
-            chunk = data = self.sock.recv(1)
-            frames = []
-            data = partial + chunk
-            frames, partial = self.parse_sockjs(data)
+            chunk = self.sock.recv(self.buffer_size)
+            if not chunk:
+                break
 
-            for frame in frames:
+            if self.dechunker is not None:
+                chunk = self.dechunker.feed(chunk)
+
+            for frame in self.parser.feed(chunk):
                 self.handle_sockjs_frame(frame)
 
+            if self.dechunker is not None and self.dechunker.done:
+                break
+
     def _close(self):
         """
             Sets the closing flag to stop polling
         """
         self.closing = True
 
+    def _abort(self):
+        """
+            Shuts down the streaming socket, to end the blocking read
+        """
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
 
 class XHRPollingTransport(SockJSTransport):
     """
@@ -303,6 +484,9 @@ class XHRPollingTransport(SockJSTransport):
 
         Reading is made by repeatedly making requests tho the sockjs endpoint,
         expecting the server to finish the request when data is received.
+        Polls are made on a keep-alive connection by a reader thread, that starts
+        the next poll as soon as a response arrives, while the previous response
+        is being handled.
 
         Writing is made by sending data to the send_url in separate requests.
 
@@ -315,13 +499,29 @@ class XHRPollingTransport(SockJSTransport):
     regular_schema = 'http'
     secure_schema = 'https'
 
+    # Max seconds waiting for a poll response. The server answers with a
+    # heartbeat frame before, so a longer wait means a dead connection.
+    poll_timeout = 35
+
+    # Max seconds waiting for responses without checking for interruptions
+    wait_interval = 1
+
+    def __init__(self, url, prefix, use_gevent=False, session=None, poll_timeout=None):
+        """
+            Custom init method to allow tuning the poll timeout
+        """
+        if poll_timeout is not None:
+            self.poll_timeout = poll_timeout
+        self.responses = None
+        super(XHRPollingTransport, self).__init__(url, prefix, use_gevent=use_gevent, session=session)
+
     # SockJSTransport implementation
 
     def _send(self, message):
         """
             Make a Http requst to send the message to the server
         """
-        response = requests.post(
+        response = self.session.post(
             self.send_url,
             message,
             headers={'Content-Type': 'text/plain'})
@@ -329,117 +529,81 @@ class XHRPollingTransport(SockJSTransport):
 
     def _start(self):
         """
-            Loops until closing "event" is found.
+            Loops until closing "event" is found, handling the responses
+            received by the reader.
         """
-        data = ""
-        partial = ''
+        if self.use_gevent:
+            import gevent
+            from gevent.queue import Empty
+            from gevent.queue import Queue
+            self.responses = Queue()
+            gevent.spawn(self.poll_loop)
+        else:
+            from Queue import Empty
+            from Queue import Queue
+            self.responses = Queue()
+            reader = threading.Thread(target=self.poll_loop)
+            reader.daemon = True
+            reader.start()
+
         while not self.closing:
-            chunk = requests.post(self.url).content
-            frames = []
-            data = partial + chunk
-            frames, partial = self.parse_sockjs(data)
+            # Wait with a timeout, as waits without it can't be interrupted
+            try:
+                chunk = self.responses.get(timeout=self.wait_interval)
+            except Empty:
+                continue
+            if chunk is None:
+                break
 
-            for frame in frames:
+            for frame in self.parser.feed(chunk):
                 self.handle_sockjs_frame(frame)
 
-    def _close(self):
-        """
-            Sets the closing flag to stop polling
+    def poll_loop(self):
         """
-        self.closing = True
-
-
-class WebsocketTransport(SockJSTransport):
-    """
-        Transport that uses a websocket to communicate.
-
-        Reading and writing is made trough the ws object created. This object
-        manages its own thread that listens at the opened socket.
-    """
-
-    transport_id = 'websocket'
-    regular_schema = 'ws'
-    secure_schema = 'wss'
-
-    def __init__(self, url, prefix, use_gevent=False):
+            Polls the server until closing, queuing the responses. None is
+            queued when polling stops.
         """
-            Custom init method to format specific websocket schema, if url
-            has been parsed from a http resource
-        """
-        self.use_gevent = use_gevent
-        self.client_class = GeventWebSocketClient if use_gevent else ThreadedWebSocketClient
-        super(WebsocketTransport, self).__init__(url.replace('http', 'ws'), prefix)
-
-    # SockJSTransport implementation
-
-    def _send(self, message):
-        """
-            Sends a message trough the websocket connection
-        """
-        self.ws.send(message)
-
-    def _connect(self):
-        """
-            Opens the websocket connetion. Opened event on the
-            ws object is eluded, because open event is managed by
-            sockhs sending an OPEN frame, not websocket opening the connection.
-        """
-        self.ws = self.client_class(self.url)
-        self.ws.opened = self.noop
-        self.ws.closed = self.ws_on_close
-
-        # When on gevent mode, messages will be handled inside the
-        # gevent receive loop, so don't bind received_message to be
-        # able to exit the loop on close call
-        if not self.use_gevent:
-            self.ws.received_message = self.ws_handle_frame
-
-        self.ws.connect()
-
-    def _start(self):
-        """
-            Start listening thread
-        """
-        if self.use_gevent:
-            self.ws_gevent_loop()
-        else:
-            self.ws.run_forever()
+        from requests.exceptions import RequestException
+        try:
+            while not self.closing:
+                response = self.session.post(self.url, timeout=self.poll_timeout)
+                if response.status_code != 200:
+                    break
+                self.responses.put(response.content)
+        except RequestException:
+            pass
+        self.responses.put(None)
 
     def _close(self):
         """
-            Close websocket connection and thread
+            Sets the closing flag to stop polling, and stops waiting
+            for the poll in course.
         """
-        self.ws.close()
         self.closing = True
+        if self.responses is not None:
+            self.responses.put(None)
 
-    # Websocket object event handlers
 
-    def ws_on_close(self, code, reason):
-        """
-            Triggered by the websocket client thread when a remote disconnection occurs.
-        """
-        self.on_close('{} "{}"'.format(code, reason))
+# Available transports, indexed by transport_id. Transports with heavy
+# dependencies are registered by the path of their class, and imported
+# when first used.
+TRANSPORTS = {
+    XHRPollingTransport.transport_id: XHRPollingTransport,
+    XHRStreamingTransport.transport_id: XHRStreamingTransport,
+    'websocket': 'utalkpythonclient.websocket.WebsocketTransport',
+}
 
-    def ws_handle_frame(self, ws_frame):
-        """
-            Triggered by the websocket client thread when a frame arrives
-        """
-        frames, partial = self.parse_sockjs(ws_frame.data)
 
-        for frame in frames:
-            self.handle_sockjs_frame(frame)
+def get_transport_class(transport_id):
+    """
+        Returns the class of a transport, importing it if needed.
+    """
+    transport_class = TRANSPORTS[transport_id]
+    if isinstance(transport_class, basestring):
+        module_name, class_name = transport_class.rsplit('.', 1)
+        transport_class = TRANSPORTS[transport_id] = getattr(import_module(module_name), class_name)
+    return transport_class
 
-    def ws_gevent_loop(self):
-        """
-            Alternative loop to use when running on gevent
-        """
-        while not self.closing:
-            ws_frame = self.ws.receive()
-            if ws_frame is not None:
-                self.ws_handle_frame(ws_frame)
-            else:
-                break
 
-# Make a mapping of the available transports, indexed by transport_id
-TRANSPORTS = set([obj for obj in locals().values() if getattr(obj, '__base__', '') is SockJSTransport])
-TRANSPORTS = {transport.transport_id: transport for transport in TRANSPORTS}
+# Kept importable from here, but only imported when accessed
+lazy_attributes(__name__, WebsocketTransport=TRANSPORTS['websocket'])
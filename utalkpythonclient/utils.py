@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from importlib import import_module
+
+import calendar
+import sys
+import threading
+import types
+
+# Epoch seconds of the timestamps already parsed, indexed by the timestamp up to seconds.
+# Timestamps of messages being received are always close, so this will be small
+TIMESTAMP_SECONDS = {}
+TIMESTAMP_SECONDS_SIZE = 1024
+
+
+class LRUCache(object):
+    """
+        Mapping with a limited number of entries. When full, the least
+        recently used entry is discarded to make room for the new one.
+
+        Thread safe, as caches are shared by clients listening on
+        different threads.
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        """
+            Returns the value of a key, marking it as the most recently used.
+        """
+        with self.lock:
+            try:
+                value = self.entries.pop(key)
+            except KeyError:
+                return default
+            self.entries[key] = value
+            return value
+
+    def set(self, key, value):
+        """
+            Stores a value, discarding the least recently used if full.
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+            return value
+
+
+class LazyModule(types.ModuleType):
+    """
+        Module importing some of its attributes when first accessed, from
+        their dotted paths. Replaces the original module on sys.modules.
+    """
+
+    def __init__(self, module, paths):
+        super(LazyModule, self).__init__(module.__name__, module.__doc__)
+        self.__dict__.update(module.__dict__)
+        # Keep the original module, as its globals are cleared when collected
+        self.__original__ = module
+        self.__lazy__ = paths
+
+    def __getattr__(self, name):
+        path = self.__lazy__.get(name)
+        if path is None:
+            raise AttributeError("'module' object has no attribute '{}'".format(name))
+        module_name, attribute = path.rsplit('.', 1)
+        value = getattr(import_module(module_name), attribute)
+        setattr(self, name, value)
+        return value
+
+
+def lazy_attributes(module_name, **paths):
+    """
+        Makes the named attributes of a module to be imported from their
+        dotted paths when first accessed.
+    """
+    sys.modules[module_name] = LazyModule(sys.modules[module_name], paths)
+
+
+def parse_timestamp(timestamp):
+    """
+        Parses a %Y-%m-%dT%H:%M:%S.%fZ UTC timestamp as used on
+        maxcarrot messages, and returns it as epoch seconds.
+    """
+    prefix = timestamp[:19]
+    seconds = TIMESTAMP_SECONDS.get(prefix)
+    if seconds is None:
+        seconds = calendar.timegm((
+            int(prefix[0:4]), int(prefix[5:7]), int(prefix[8:10]),
+            int(prefix[11:13]), int(prefix[14:16]), int(prefix[17:19])))
+        if len(TIMESTAMP_SECONDS) >= TIMESTAMP_SECONDS_SIZE:
+            TIMESTAMP_SECONDS.clear()
+        TIMESTAMP_SECONDS[prefix] = seconds
+
+    fraction = timestamp[20:].rstrip('Z')
+    if fraction:
+        return seconds + int(fraction) / float(10 ** len(fraction))
+    return float(seconds)
@@ -0,0 +1,120 @@
+from utalkpythonclient.transports import SockJSTransport
+from ws4py.client import WebSocketBaseClient
+from ws4py.client.threadedclient import WebSocketClient as ThreadedWebSocketClient
+
+import wsaccel
+
+wsaccel.patch_ws4py()
+
+
+class WebsocketTransport(SockJSTransport):
+    """
+        Transport that uses a websocket to communicate.
+
+        Reading and writing is made trough the ws object created. This object
+        manages its own thread that listens at the opened socket, unless the
+        transport is managed by a ConnectionManager, that listens on the sockets
+        of all the transports it manages from a single thread.
+    """
+
+    transport_id = 'websocket'
+    regular_schema = 'ws'
+    secure_schema = 'wss'
+
+    # ConnectionManager listening on this transport socket, if any
+    manager = None
+
+    def __init__(self, url, prefix, use_gevent=False, session=None):
+        """
+            Custom init method to format specific websocket schema, if url
+            has been parsed from a http resource
+        """
+        self.use_gevent = use_gevent
+        if use_gevent:
+            from ws4py.client.geventclient import WebSocketClient as GeventWebSocketClient
+            self.client_class = GeventWebSocketClient
+        else:
+            self.client_class = ThreadedWebSocketClient
+        super(WebsocketTransport, self).__init__(url.replace('http', 'ws'), prefix, use_gevent=use_gevent, session=session)
+
+    # SockJSTransport implementation
+
+    def _send(self, message):
+        """
+            Sends a message trough the websocket connection
+        """
+        self.ws.send(message)
+
+    def _connect(self):
+        """
+            Opens the websocket connetion. Opened event on the
+            ws object is eluded, because open event is managed by
+            sockhs sending an OPEN frame, not websocket opening the connection.
+        """
+        managed = self.manager is not None
+        self.ws = WebSocketBaseClient(self.url) if managed else self.client_class(self.url)
+        self.ws.opened = self.noop
+        self.ws.closed = self.ws_on_close
+
+        # When on gevent mode, messages will be handled inside the
+        # gevent receive loop, so don't bind received_message to be
+        # able to exit the loop on close call
+        if managed or not self.use_gevent:
+            self.ws.received_message = self.ws_handle_frame
+
+        self.ws.connect()
+
+        if managed:
+            self.manager.register(self.ws)
+
+    def _start(self):
+        """
+            Start listening thread
+        """
+        if self.manager is not None:
+            # Frames are dispatched from the manager thread
+            return
+        elif self.use_gevent:
+            self.ws_gevent_loop()
+        else:
+            self.ws.run_forever()
+
+    def _close(self):
+        """
+            Close websocket connection and thread
+        """
+        self.ws.close()
+        self.closing = True
+
+    def _abort(self):
+        """
+            Shuts down the websocket socket, to end the blocking read
+            without waiting for the closing handshake.
+        """
+        self.ws.close_connection()
+
+    # Websocket object event handlers
+
+    def ws_on_close(self, code, reason):
+        """
+            Triggered by the websocket client thread when a remote disconnection occurs.
+        """
+        self.on_close('{} "{}"'.format(code, reason))
+
+    def ws_handle_frame(self, ws_frame):
+        """
+            Triggered by the websocket client thread when a frame arrives
+        """
+        for frame in self.parser.feed(ws_frame.data):
+            self.handle_sockjs_frame(frame)
+
+    def ws_gevent_loop(self):
+        """
+            Alternative loop to use when running on gevent
+        """
+        while not self.closing:
+            ws_frame = self.ws.receive()
+            if ws_frame is not None:
+                self.ws_handle_frame(ws_frame)
+            else:
+                break